@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark add_svg_highlights() with every line of the document highlighted.
+
+The per-line cost should stay flat from 10 to 100k highlighted lines; the
+quadratic implementation it replaced copied the whole document once per line.
+
+Usage:
+    python benchmarks/bench_highlights.py [--legacy]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pygments import highlight  # noqa: E402
+from pygments.lexers import TextLexer  # noqa: E402
+from snippet2image import Renderer, add_svg_highlights  # noqa: E402
+
+LINE_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+# The legacy implementation is quadratic; stop before it takes minutes
+LEGACY_MAX_LINES = 10_000
+
+
+def legacy_add_svg_highlights(svg_content, highlight_lines, highlight_color='#ffffcc'):
+    """The previous implementation: one full-document copy per highlighted line."""
+    import re
+    matches = list(re.finditer(r'<text[^>]+y="([^"]+)"[^>]+text-anchor="end"[^>]*>',
+                               svg_content))
+    rectangles = []
+    for line_num in highlight_lines:
+        if 0 < line_num <= len(matches):
+            match = matches[line_num - 1]
+            rect_y = float(match.group(1)) - 14 * 0.85
+            rect = (f'<rect x="0" y="{rect_y}" width="800" height="16.8" '
+                    f'fill="{highlight_color}" fill-opacity="0.3"/>')
+            rectangles.append((match.start(), rect))
+    for pos, rect in sorted(rectangles, reverse=True):
+        svg_content = svg_content[:pos] + rect + '\n' + svg_content[pos:]
+    return svg_content
+
+
+def make_svg(line_count):
+    """Render a synthetic document with line numbers, as code_to_image() does."""
+    code = ''.join(f"line {i}: value = compute({i}, {i * 7})\n" for i in range(line_count))
+    return highlight(code, TextLexer(), Renderer().formatter('svg'))
+
+
+def bench(func, svg, lines, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(svg, lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with_legacy = '--legacy' in sys.argv[1:]
+    header = f"{'lines':>8} {'doc size':>10} {'total ms':>10} {'us/line':>9}"
+    if with_legacy:
+        header += f" {'legacy ms':>10} {'legacy us/line':>15}"
+    print(header)
+
+    for line_count in LINE_COUNTS:
+        svg = make_svg(line_count)
+        lines = list(range(1, line_count + 1))
+        repeat = max(1, 10_000 // line_count)
+
+        elapsed = bench(add_svg_highlights, svg, lines, repeat)
+        row = (f"{line_count:>8} {len(svg) / 1024:>8.0f}KB {elapsed * 1000:>10.2f} "
+               f"{elapsed / line_count * 1e6:>9.2f}")
+        if with_legacy and line_count <= LEGACY_MAX_LINES:
+            legacy = bench(legacy_add_svg_highlights, svg, lines, 1)
+            row += f" {legacy * 1000:>10.2f} {legacy / line_count * 1e6:>15.2f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
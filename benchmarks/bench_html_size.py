@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Compare HTML output sizes of the inline, embedded and external CSS modes.
+
+The corpus is this repository's own source and text files, cut into
+snippets of SNIPPET_LINES lines the way documentation pages quote code. A
+page quoting every snippet costs the sum of its fragments in the inline
+and embedded modes, and the fragments plus one shared stylesheet in the
+external mode.
+
+Usage:
+    python benchmarks/bench_html_size.py [style ...]
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from snippet2image import HTML_CSS_MODES, html_stylesheet, render  # noqa: E402
+
+CORPUS = ['snippet2image.py', 'snippet2image_client.py', 'README.md', 'pyproject.toml',
+          'demos/demo.py', 'demos/demo.html']
+SNIPPET_LINES = 40
+
+
+def load_corpus():
+    """Yield (file name, snippet) pairs."""
+    for name in CORPUS:
+        with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+            lines = f.readlines()
+        for start in range(0, len(lines), SNIPPET_LINES):
+            snippet = ''.join(lines[start:start + SNIPPET_LINES])
+            if snippet.strip():
+                yield name, snippet
+
+
+def main():
+    styles = sys.argv[1:] or ['monokai', 'github-dark']
+    snippets = list(load_corpus())
+    print(f"{len(snippets)} snippets of up to {SNIPPET_LINES} lines, "
+          f"{sum(len(code) for _, code in snippets) / 1024:.0f}KB of code")
+    print(f"{'style':>12} " + ' '.join(f'{mode:>10}' for mode in HTML_CSS_MODES)
+          + f" {'stylesheet':>11} {'saved':>7}")
+
+    for style in styles:
+        totals = {}
+        for mode in HTML_CSS_MODES:
+            totals[mode] = sum(
+                len(render(code, 'html', filename=name, style=style, html_css=mode)
+                    .content.encode('utf-8'))
+                for name, code in snippets)
+        stylesheet = len(html_stylesheet([style]).encode('utf-8'))
+        external = totals['external'] + stylesheet
+        print(f"{style:>12} " + ' '.join(f'{totals[mode] / 1024:>8.0f}KB' for mode in HTML_CSS_MODES)
+              + f" {stylesheet / 1024:>9.1f}KB {(1 - external / totals['inline']) * 100:>6.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Import-time regression benchmark for the command line's fast paths.
+
+Each command runs in a fresh interpreter, best of REPEAT runs, and is
+reported on top of a bare interpreter's startup. The runs of every command
+are interleaved, so a busy machine slows them all alike. `import
+snippet2image`, --help and --list-styles (from a warm style index) must
+cost at most MAX_FRACTION of importing the module together with the lazy
+modules, a budget that scales with the machine instead of a fixed number
+of milliseconds. Importing the module must not pull in pygments' lexers,
+formatters or styles, asyncio or concurrent.futures, which only the paths
+that render or serve need. Exits with status 1 when a check fails, so it
+can guard CI.
+
+Usage:
+    python benchmarks/bench_import.py [max_fraction]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+REPEAT = 15
+# About 0.35-0.45 on a quiet machine; the margin absorbs scheduling noise
+MAX_FRACTION = 0.65
+LAZY_MODULES = ['pygments.lexers', 'pygments.formatters', 'pygments.styles',
+                'pygments.lexer', 'snippet2image_formatters', 'asyncio', 'concurrent.futures']
+
+COMMANDS = [
+    ('import snippet2image', ['-c', 'import snippet2image']),
+    ('--help', ['-c', 'import sys, snippet2image; sys.argv[1:] = ["--help"]; snippet2image.main()']),
+    ('--list-styles', ['-c', 'import sys, snippet2image; sys.argv[1:] = ["--list-styles"]; '
+                             'snippet2image.main()']),
+]
+
+
+def run(commands, env):
+    """Best wall time of a fresh interpreter running each command's args, in milliseconds."""
+    best = {name: float('inf') for name, _ in commands}
+    for _ in range(REPEAT):
+        for name, args in commands:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=ROOT, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            best[name] = min(best[name], time.perf_counter() - start)
+    return {name: elapsed * 1000 for name, elapsed in best.items()}
+
+
+def main():
+    max_fraction = float(sys.argv[1]) if len(sys.argv) > 1 else MAX_FRACTION
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # Measure with bytecode cached, as installed
+    # Warm the bytecode and the style index
+    for _, args in COMMANDS:
+        subprocess.run([sys.executable, *args], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    failed = False
+    probe = ('import sys, snippet2image; '
+             f'print(" ".join(m for m in {LAZY_MODULES!r} if m in sys.modules))')
+    eager = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=env, check=True,
+                           capture_output=True, text=True).stdout.split()
+    if eager:
+        print(f"FAIL: import snippet2image imports {', '.join(eager)}")
+        failed = True
+
+    reference = ('eager import', ['-c', f'import snippet2image, {", ".join(LAZY_MODULES)}'])
+    times = run([('startup', ['-c', 'pass']), reference, *COMMANDS], env)
+    startup = times.pop('startup')
+    eager = times.pop(reference[0]) - startup
+    budget = eager * max_fraction
+    print(f"interpreter startup: {startup:.1f} ms; eager import {eager:.1f} ms on top of it; "
+          f"budget {max_fraction:.0%} of that, {budget:.1f} ms")
+    for name, _ in COMMANDS:
+        elapsed = times[name] - startup
+        status = 'ok' if elapsed <= budget else 'FAIL'
+        failed |= status == 'FAIL'
+        print(f"{name:>22}: {elapsed:6.1f} ms ({elapsed / eager:4.0%})  {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
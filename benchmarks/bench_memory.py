@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark peak memory of buffered and streamed renders of large inputs.
+
+A buffered render holds the whole document in memory before writing it; a
+streamed one (code_to_image(stream=True), render_to()) formats tokens
+straight into the output file. The script traces Python allocations with
+tracemalloc and reports the peak on top of the input string itself: it
+grows with the input when buffered and stays roughly flat when streamed.
+Tracing slows rendering down several times, so the inputs are kept small.
+
+Usage:
+    python benchmarks/bench_memory.py [svg|html]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from snippet2image import code_to_image  # noqa: E402
+
+SIZES_MB = [0.1, 0.25, 0.5, 1]
+
+SNIPPET = '''\
+def fibonacci(n):
+    """Generate Fibonacci sequence."""
+    a, b = 0, 1
+    for _ in range(n):
+        yield a
+        a, b = b, a + b
+
+'''
+
+
+def measure(code, output_file, format_type, stream):
+    """Render once; returns (peak traced bytes, seconds)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    code_to_image(code, output_file, format_type=format_type, language='python',
+                  highlight_lines='1-100', stream=stream, verbose=False)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    format_type = sys.argv[1] if len(sys.argv) > 1 else 'svg'
+    print(f"{format_type.upper()} output")
+    print(f"{'input':>8} {'output':>9} {'buffered peak':>14} {'streamed peak':>14} "
+          f"{'buffered s':>11} {'streamed s':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, f'out.{format_type}')
+        # Warm up lexer and formatter memos so they don't count as render memory
+        code_to_image(SNIPPET, output_file, format_type=format_type, language='python',
+                      verbose=False)
+
+        for size_mb in SIZES_MB:
+            code = SNIPPET * int(size_mb * 1024 * 1024 / len(SNIPPET))
+            buffered, buffered_time = measure(code, output_file, format_type, False)
+            streamed, streamed_time = measure(code, output_file, format_type, True)
+            output_mb = os.path.getsize(output_file) / 1024 / 1024
+            print(f"{len(code) / 1024 / 1024:>6.2f}MB {output_mb:>7.1f}MB "
+                  f"{buffered / 1024 / 1024:>12.1f}MB {streamed / 1024 / 1024:>12.1f}MB "
+                  f"{buffered_time:>11.2f} {streamed_time:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
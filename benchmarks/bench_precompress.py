@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark pre-compressed output against a separate compression pass.
+
+Static hosting serves gzip files next to the plain ones. The separate pass
+renders every file, then reads each one back and writes its .gz; with
+precompress the .gz is compressed from the document in memory while the
+plain file is written. Both produce byte-identical .gz files, which the
+script checks. The corpus is this repository's files rendered as SVG and
+HTML, several times over to make a batch.
+
+Usage:
+    python benchmarks/bench_precompress.py [copies]
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from snippet2image import code_to_image  # noqa: E402
+
+CORPUS = ['snippet2image.py', 'snippet2image_client.py', 'README.md', 'pyproject.toml',
+          'demos/demo.py', 'demos/demo.html']
+
+
+def load_corpus():
+    """Return (file name, code) pairs."""
+    corpus = []
+    for name in CORPUS:
+        with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+            corpus.append((name, f.read()))
+    return corpus
+
+
+def render_batch(corpus, directory, copies, precompress):
+    """Render every file as SVG and HTML; returns the output paths."""
+    outputs = []
+    for copy in range(copies):
+        for name, code in corpus:
+            for extension in ('svg', 'html'):
+                output = os.path.join(directory, f'{copy}-{os.path.basename(name)}.{extension}')
+                code_to_image(code, output, format_type=extension, filename=name,
+                              precompress=precompress, verbose=False)
+                outputs.append(output)
+    return outputs
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def compress_pass(outputs):
+    """The separate build step: read every file back and write its .gz."""
+    for output in outputs:
+        data = read_bytes(output)
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        with open(output + '.gz', 'wb') as f:
+            f.write(compressor.compress(data) + compressor.flush())
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    corpus = load_corpus()
+    with tempfile.TemporaryDirectory() as separate, tempfile.TemporaryDirectory() as inline:
+        # Warm up lexers, formatters and the token cache so both runs render alike
+        render_batch(corpus, separate, 1, ())
+
+        start = time.perf_counter()
+        outputs = render_batch(corpus, separate, copies, ())
+        render_time = time.perf_counter() - start
+        start = time.perf_counter()
+        compress_pass(outputs)
+        pass_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_batch(corpus, inline, copies, ['gzip'])
+        inline_time = time.perf_counter() - start
+
+        plain = sum(os.path.getsize(output) for output in outputs)
+        compressed = sum(os.path.getsize(output + '.gz') for output in outputs)
+        identical = all(
+            read_bytes(output + '.gz')
+            == read_bytes(os.path.join(inline, os.path.basename(output)) + '.gz')
+            and gzip.decompress(read_bytes(output + '.gz')) == read_bytes(output)
+            for output in outputs)
+
+    print(f"{len(outputs)} files, {plain / 1024 / 1024:.1f}MB plain, "
+          f"{compressed / 1024 / 1024:.1f}MB gzip")
+    print(f"render then compress pass: {(render_time + pass_time):.2f} s "
+          f"(render {render_time:.2f} s + pass {pass_time:.2f} s)")
+    print(f"render with precompress:   {inline_time:.2f} s")
+    print(f"identical .gz files:       {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark single-pass SVG generation against the old post-processing path.
+
+The old path ran pygments' SvgFormatter and then patched the document: a
+replace() for width/height/viewBox, add_svg_highlights() for the highlight
+rectangles and another replace() for the background. SnippetSvgFormatter
+writes the same document in one pass. The script also checks that both paths
+produce identical output. Tokens are lexed once up front, so the numbers
+compare formatting and post-processing only.
+
+Usage:
+    python benchmarks/bench_svg.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pygments import format as format_tokens  # noqa: E402
+from pygments.formatters import SvgFormatter  # noqa: E402
+from pygments.lexers import PythonLexer  # noqa: E402
+from snippet2image import (  # noqa: E402
+    LineRanges, Renderer, add_svg_highlights, svg_dimensions,
+)
+
+LINE_COUNTS = [100, 1_000, 10_000, 50_000]
+FONT_SIZE = 14
+
+SNIPPET = '''\
+def fibonacci(n):
+    """Generate Fibonacci sequence."""
+    a, b = 0, 1
+    for _ in range(n):
+        yield a
+        a, b = b, a + b
+
+'''
+
+
+LEGACY_FORMATTER = SvgFormatter(style='monokai', linenos=True, fontfamily='monospace',
+                                fontsize=f"{FONT_SIZE}px", cssclass="highlight")
+SINGLE_PASS_FORMATTER = Renderer(style='monokai', font_size=FONT_SIZE).formatter('svg')
+
+
+def legacy_render(code, tokens, highlight_lines):
+    """The post-processing path code_to_image() used before SnippetSvgFormatter."""
+    content = format_tokens(tokens, LEGACY_FORMATTER)
+    svg_width, svg_height = svg_dimensions(code, FONT_SIZE)
+    content = content.replace(
+        '<svg xmlns="http://www.w3.org/2000/svg">',
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">'
+    )
+    content = add_svg_highlights(content, highlight_lines)
+    return content.replace('background: #', 'background: transparent; /* #')
+
+
+def single_pass_render(code, tokens, highlight_lines):
+    svg_width, svg_height = svg_dimensions(code, FONT_SIZE)
+    formatter = SINGLE_PASS_FORMATTER.for_document(svg_width, svg_height, highlight_lines)
+    return format_tokens(tokens, formatter)
+
+
+def best_of(func, repeat, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    lexer = PythonLexer(stripall=True)
+    print(f"{'lines':>7} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8} {'identical':>10}")
+    for line_count in LINE_COUNTS:
+        code = (SNIPPET * (line_count // SNIPPET.count('\n') + 1)).strip()
+        tokens = list(lexer.get_tokens(code))
+        # Highlight every third line
+        highlight_lines = LineRanges((line, line) for line in range(1, line_count + 1, 3))
+        repeat = max(1, 5_000 // line_count)
+
+        legacy_time, legacy = best_of(legacy_render, repeat, code, tokens, highlight_lines)
+        new_time, new = best_of(single_pass_render, repeat, code, tokens, highlight_lines)
+        print(f"{line_count:>7} {legacy_time * 1000:>10.1f} {new_time * 1000:>15.1f} "
+              f"{legacy_time / new_time:>7.2f}x {str(legacy == new):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Compare the size of the default and compact SVG output, and check that
+both render the same.
+
+The listing is this repository's own source, cut or repeated to LINE_COUNT
+lines. The check parses both documents, resolves every character's
+position, fill, weight and slant (through presentation attributes in the
+default output and through the embedded stylesheet's classes in the
+compact one) and compares them together with the background and
+highlight rectangles. Whitespace only has to be in the same place, since
+its color doesn't show. With a dark style, the light color table is
+checked.
+
+Usage:
+    python benchmarks/bench_svg_size.py [style[:dark_style] ...]
+"""
+
+import gzip
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from snippet2image import render  # noqa: E402
+
+LINE_COUNT = 2000
+HIGHLIGHT_LINES = '10-20 500 1500-'
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+INITIAL_STYLE = {'fill': '#000000', 'font-weight': 'normal', 'font-style': 'normal'}
+CSS_RULE_PATTERN = re.compile(r'([^{}]+)\{([^{}]*)\}')
+
+
+def load_listing():
+    with open(os.path.join(ROOT, 'snippet2image.py'), encoding='utf-8') as f:
+        lines = f.readlines()
+    lines = (lines * (LINE_COUNT // len(lines) + 1))[:LINE_COUNT]
+    return ''.join(lines)
+
+
+def class_rules(root):
+    """Declarations of every selector in the document's light color table."""
+    rules = {}
+    style = root.find(f'{SVG_NAMESPACE}style')
+    if style is not None:
+        css = style.text.split('@media', 1)[0]
+        for selectors, body in CSS_RULE_PATTERN.findall(css):
+            declarations = dict(item.split(':', 1) for item in body.split(';') if item)
+            for selector in selectors.split(','):
+                rules.setdefault(selector.strip(), {}).update(declarations)
+    return rules
+
+
+def number(value):
+    """A coordinate rounded the way the compact output rounds it; percentages as is."""
+    return value if value.endswith('%') else round(float(value), 2)
+
+
+def effective_style(element, inherited, rules):
+    style = dict(inherited)
+    for name in element.get('class', '').split():
+        style.update(rules.get(f'.{name}', {}))
+    for key in INITIAL_STYLE:
+        if element.get(key) is not None:
+            style[key] = element.get(key)
+    return style
+
+
+def rendering(svg):
+    """
+    Reduce an SVG document to what it looks like.
+
+    Returns:
+        Dict with the document size, its rectangles and, per text position,
+        the characters with their style
+    """
+    root = ET.fromstring(svg)
+    rules = class_rules(root)
+    style = dict(INITIAL_STYLE, **rules.get('svg', {}))
+    style = effective_style(root, style, rules)
+    rects = []
+    chunks = {}
+
+    def visit(element, style, position):
+        style = effective_style(element, style, rules)
+        tag = element.tag.replace(SVG_NAMESPACE, '')
+        if tag == 'rect':
+            opacity = rules.get(f".{element.get('class')}", {}).get('fill-opacity')
+            rects.append((number(element.get('x', '0')), number(element.get('y', '0')),
+                          number(element.get('width')), number(element.get('height')),
+                          style['fill'].lower(), element.get('fill-opacity', opacity)))
+            return
+        if tag in ('text', 'tspan'):
+            if element.get('text-anchor'):
+                position = position[:2] + (element.get('text-anchor'),)
+            if element.get('x') is not None:
+                position = (float(element.get('x')), float(element.get('y')), position[2])
+            add_text(element.text, style, position)
+        for child in element:
+            visit(child, style, position)
+            add_text(child.tail, style, position)
+
+    def add_text(text, style, position):
+        if text and position[0] is not None:
+            chunk = chunks.setdefault(position, [])
+            for char in text.replace('\xa0', ' '):
+                # Whitespace looks the same whatever its style
+                chunk.append((char, None) if char.isspace() else
+                             (char, style['fill'].lower(), style['font-weight'],
+                              style['font-style']))
+
+    visit(root, style, (None, None, 'start'))
+    for position, chunk in list(chunks.items()):
+        while chunk and chunk[-1][1] is None:
+            chunk.pop()  # Trailing whitespace doesn't show
+        if not chunk:
+            del chunks[position]
+    rects.sort()
+    size = (root.get('width'), root.get('height'), root.get('viewBox'))
+    return {'size': size, 'rects': rects, 'text': chunks}
+
+
+def check_equivalent(default_svg, compact_svg):
+    """Return a list of differences between how two SVG documents render."""
+    default, compact = rendering(default_svg), rendering(compact_svg)
+    problems = []
+    if default['size'] != compact['size']:
+        problems.append(f"size {default['size']} != {compact['size']}")
+    if default['rects'] != compact['rects']:
+        problems.append(f"{len(default['rects'])} rectangles differ from {len(compact['rects'])}")
+    for position in sorted(set(default['text']) | set(compact['text'])):
+        if default['text'].get(position) != compact['text'].get(position):
+            problems.append(f"text at {position} differs")
+    return problems
+
+
+def main():
+    configurations = sys.argv[1:] or ['monokai', 'default', 'default:monokai']
+    code = load_listing()
+    print(f"{LINE_COUNT} lines, {len(code) / 1024:.0f}KB of Python")
+    print(f"{'style':>16} {'default':>9} {'compact':>9} {'saved':>6} "
+          f"{'gzip':>7} {'compact gzip':>13} {'default ms':>11} {'compact ms':>11} {'same':>5}")
+
+    for configuration in configurations:
+        style, _, dark_style = configuration.partition(':')
+        options = dict(language='python', style=style, dark_style=dark_style or None,
+                       highlight_lines=HIGHLIGHT_LINES, transparent=False)
+        render(code, **options)  # Warm up the lexer and formatter
+        start = time.perf_counter()
+        default = render(code, **options).content
+        default_time = time.perf_counter() - start
+        start = time.perf_counter()
+        compact = render(code, compact_svg=True, **options).content
+        compact_time = time.perf_counter() - start
+
+        problems = check_equivalent(default, compact)
+        sizes = [len(content.encode('utf-8')) for content in (default, compact)]
+        gzipped = [len(gzip.compress(content.encode('utf-8'))) for content in (default, compact)]
+        print(f"{configuration:>16} {sizes[0] / 1024:>7.0f}KB {sizes[1] / 1024:>7.0f}KB "
+              f"{(1 - sizes[1] / sizes[0]) * 100:>5.0f}% {gzipped[0] / 1024:>5.0f}KB "
+              f"{gzipped[1] / 1024:>11.0f}KB {default_time * 1000:>11.0f} "
+              f"{compact_time * 1000:>11.0f} {'yes' if not problems else 'NO':>5}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,104 +9,217 @@ import sys
 import argparse
 import os
 import re
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name, guess_lexer
-from pygments.formatters import SvgFormatter, HtmlFormatter
-from pygments.styles import get_all_styles
-from pygments.util import ClassNotFound
+import json
+import signal
+import socket
+import socketserver
+import threading
+import time
+import fnmatch
+import hashlib
+import copy
+import contextlib
+import bisect
+import itertools
+import zlib
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+# Only pygments' package module is imported up front: lexers, formatters,
+# styles and heavy standard library modules (asyncio, concurrent.futures)
+# are imported by the code paths that use them, so --help, --list-styles
+# and argument errors don't wait for them
+import pygments
+from pygments import format as format_tokens
+
+__version__ = '0.1.0'
+
+
+class LineRanges:
+    """
+    Compact set of line numbers stored as sorted, merged inclusive intervals.
+
+    Memory scales with the number of ranges rather than the number of lines,
+    membership tests are O(log n) via bisection, and an interval may be
+    open-ended (end None, as in "100-") to cover every line from its start.
+
+    Examples:
+        >>> ranges = LineRanges([(8, 10), (15, 15), (9, 12)])
+        >>> ranges
+        LineRanges('8-12 15')
+        >>> 11 in ranges, 13 in ranges
+        (True, False)
+        >>> list(ranges)
+        [8, 9, 10, 11, 12, 15]
+    """
+
+    __slots__ = ('intervals', '_starts')
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals, key=lambda interval: interval[0]):
+            if merged:
+                last_start, last_end = merged[-1]
+                # Merge overlapping and adjacent intervals
+                if last_end is None or start <= last_end + 1:
+                    if last_end is not None and (end is None or end > last_end):
+                        merged[-1] = (last_start, end)
+                    continue
+            merged.append((start, end))
+        self.intervals = tuple(merged)
+        self._starts = [start for start, _ in merged]
+
+    @classmethod
+    def coerce(cls, value):
+        """
+        Convert a range spec string, an iterable of line numbers or None to LineRanges.
+        """
+        if isinstance(value, cls):
+            return value
+        if not value:
+            return cls()
+        if isinstance(value, str):
+            return parse_line_ranges(value)
+        return cls((line, line) for line in value)
+
+    def __contains__(self, line):
+        i = bisect.bisect_right(self._starts, line) - 1
+        if i < 0:
+            return False
+        end = self.intervals[i][1]
+        return end is None or line <= end
+
+    def __iter__(self):
+        """Iterate over the line numbers; never ends if the last range is open."""
+        for start, end in self.intervals:
+            yield from (range(start, end + 1) if end is not None else itertools.count(start))
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __eq__(self, other):
+        return isinstance(other, LineRanges) and self.intervals == other.intervals
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __repr__(self):
+        return f"LineRanges({self.to_spec()!r})"
+
+    def to_spec(self):
+        """Format as a range specification, e.g. '8-10 15 100-'."""
+        parts = []
+        for start, end in self.intervals:
+            if end is None:
+                parts.append(f"{start}-")
+            elif start == end:
+                parts.append(str(start))
+            else:
+                parts.append(f"{start}-{end}")
+        return ' '.join(parts)
 
 
 def parse_line_ranges(line_spec):
     """
-    Parse line range specification into a list of line numbers.
+    Parse line range specification into a set of line numbers.
 
     Args:
-        line_spec: Space-separated line numbers and ranges (e.g., "8-10 15 20-22")
+        line_spec: Space-separated line numbers and ranges (e.g., "8-10 15 20-22");
+            a range without an end (e.g., "100-") runs to the last line
 
     Returns:
-        List of integers representing line numbers
+        LineRanges holding the line numbers
 
     Examples:
-        >>> parse_line_ranges("8 9 10")
+        >>> list(parse_line_ranges("8 9 10"))
         [8, 9, 10]
-        >>> parse_line_ranges("8-10 15")
+        >>> list(parse_line_ranges("8-10 15"))
         [8, 9, 10, 15]
-        >>> parse_line_ranges("1-3 5 7-9")
+        >>> list(parse_line_ranges("1-3 5 7-9"))
         [1, 2, 3, 5, 7, 8, 9]
+        >>> parse_line_ranges("1-50000000 100-")
+        LineRanges('1-')
     """
     if not line_spec:
-        return []
+        return LineRanges()
 
-    line_numbers = set()
+    intervals = []
     parts = line_spec.split()
 
     for part in parts:
         if '-' in part:
-            # Handle range (e.g., "8-10")
+            # Handle range (e.g., "8-10" or open-ended "100-")
             try:
                 start, end = part.split('-', 1)
                 start_line = int(start.strip())
-                end_line = int(end.strip())
-                if start_line > end_line:
+                end_line = int(end.strip()) if end.strip() else None
+                if end_line is not None and start_line > end_line:
                     raise ValueError(f"Invalid range: {part} (start > end)")
-                line_numbers.update(range(start_line, end_line + 1))
+                intervals.append((start_line, end_line))
             except ValueError as e:
                 raise ValueError(f"Invalid line range '{part}': {e}")
         else:
             # Handle single line number
             try:
-                line_numbers.add(int(part.strip()))
+                line = int(part.strip())
             except ValueError:
                 raise ValueError(f"Invalid line number: {part}")
+            intervals.append((line, line))
+
+    return LineRanges(intervals)
 
-    return sorted(line_numbers)
+
+# Pygments SVG has 2 text elements per line: line number (with text-anchor="end") and code.
+# Matching only line number elements gives exactly one match per line.
+SVG_LINENO_PATTERN = re.compile(r'<text[^>]+y="([^"]+)"[^>]+text-anchor="end"[^>]*>')
+SVG_FONT_SIZE_PATTERN = re.compile(r'font-size:\s*(\d+(?:\.\d+)?)')
+SVG_WIDTH_PATTERN = re.compile(r'<svg[^>]+width="(\d+)"')
 
 
 def add_svg_highlights(svg_content, highlight_lines, highlight_color='#ffffcc'):
     """
     Add background highlights to specific lines in SVG output.
 
+    Runs in a single pass: the insertion points are collected first and the
+    document is joined once, so the cost is linear in the document size and
+    the number of highlighted lines.
+
     Args:
         svg_content: The SVG content string from Pygments
-        highlight_lines: List of line numbers to highlight (1-indexed)
+        highlight_lines: LineRanges (or list) of line numbers to highlight (1-indexed)
         highlight_color: Background color for highlighted lines
 
     Returns:
         Modified SVG content with highlight rectangles
     """
+    highlight_lines = LineRanges.coerce(highlight_lines)
     if not highlight_lines:
         return svg_content
 
     # Parse SVG to find text elements and their positions
     # SVG structure from Pygments has <text> elements with y coordinates for each line
     # We need to add <rect> elements before the highlighted lines
-
-    # Find all line number text elements
-    # Pygments SVG has 2 text elements per line: line number (with text-anchor="end") and code
-    # We match only line number elements to get exactly one match per line
-    text_pattern = r'<text[^>]+y="([^"]+)"[^>]+text-anchor="end"[^>]*>'
-    matches = list(re.finditer(text_pattern, svg_content))
+    matches = list(SVG_LINENO_PATTERN.finditer(svg_content))
 
     if not matches:
         return svg_content
 
     # Extract font size from SVG to calculate rectangle dimensions
-    font_size_match = re.search(r'font-size:\s*(\d+(?:\.\d+)?)', svg_content)
+    font_size_match = SVG_FONT_SIZE_PATTERN.search(svg_content)
     font_size = float(font_size_match.group(1)) if font_size_match else 14
 
     # Calculate line height (typically 1.2-1.5 times font size in SVG)
     line_height = font_size * 1.2
 
     # Find the viewBox or svg width to determine rectangle width
-    width_match = re.search(r'<svg[^>]+width="(\d+)"', svg_content)
+    width_match = SVG_WIDTH_PATTERN.search(svg_content)
     svg_width = int(width_match.group(1)) if width_match else 800
 
     # Build rectangles for highlighted lines
     rectangles = []
-    for line_num in highlight_lines:
-        if 0 < line_num <= len(matches):
-            # Get the y position of the line (1-indexed to 0-indexed)
-            match = matches[line_num - 1]
+    for line_num, match in enumerate(matches, 1):
+        if line_num in highlight_lines:
+            # Get the y position of the line
             y_pos = float(match.group(1))
 
             # Create rectangle that covers the entire line
@@ -115,146 +228,1925 @@ def add_svg_highlights(svg_content, highlight_lines, highlight_color='#ffffcc'):
             rect = (
                 f'<rect x="0" y="{rect_y}" width="{svg_width}" '
                 f'height="{line_height}" fill="{highlight_color}" '
-                f'fill-opacity="0.3"/>'
+                f'fill-opacity="0.3"/>\n'
             )
             rectangles.append((match.start(), rect))
 
-    # Insert rectangles before their corresponding text elements
-    # Work backwards to preserve string positions
-    for pos, rect in sorted(rectangles, reverse=True):
-        svg_content = svg_content[:pos] + rect + '\n' + svg_content[pos:]
+    # Splice rectangles in before their corresponding text elements
+    segments = []
+    last = 0
+    for pos, rect in rectangles:
+        segments.append(svg_content[last:pos])
+        segments.append(rect)
+        last = pos
+    segments.append(svg_content[last:])
+    return ''.join(segments)
+
+
+NON_WHITESPACE_PATTERN = re.compile(r'\S')
+
+
+def longest_line_length(code, chunk_size=1 << 16):
+    """
+    Length of the longest line in code.
+
+    Splits fixed-size slices instead of the whole string, so the scan
+    doesn't build a list of every line of a large input.
+    """
+    longest = carry = 0
+    for start in range(0, len(code), chunk_size):
+        lines = code[start:start + chunk_size].split('\n')
+        if len(lines) == 1:
+            # The chunk continues the current line
+            carry += len(lines[0])
+            continue
+        longest = max(longest, carry + len(lines[0]), *map(len, lines[1:-1]))
+        carry = len(lines[-1])
+    return max(longest, carry)
+
+
+def lexed_line_count(code, lexer):
+    """
+    Count the lines a lexer will produce for code, without copying it.
+
+    Mirrors the lexer's input preprocessing: newline normalization,
+    stripall/stripnl and the trailing newline it ensures.
+    """
+    start = 1 if code.startswith('\ufeff') else 0
+    end = len(code)
+    if lexer.stripall:
+        match = NON_WHITESPACE_PATTERN.search(code, start)
+        start = match.start() if match else end
+        while end > start and code[end - 1].isspace():
+            end -= 1
+    elif lexer.stripnl:
+        while start < end and code[start] in '\r\n':
+            start += 1
+        while end > start and code[end - 1] in '\r\n':
+            end -= 1
+    newlines = (code.count('\n', start, end) + code.count('\r', start, end)
+                - code.count('\r\n', start, end))
+    if end > start and code[end - 1] in '\r\n':
+        return newlines
+    return newlines + 1  # The lexer adds a final newline
+
+
+def svg_dimensions(code, font_size):
+    """
+    Compute the SVG width and height for code rendered at a font size.
+
+    Returns:
+        Tuple of (width, height) in pixels
+    """
+    line_count = code.count('\n') + 1
+    longest_line = longest_line_length(code)
+
+    # Calculate width based on code content
+    # For monospace fonts: char_width ≈ 0.6 * font_size
+    # Line numbers are at x=76, so: line_number_area + (chars * char_width) + padding
+    char_width = font_size * 0.6
+    svg_width = 76 + int(longest_line * char_width) + 40  # line numbers + code + right padding
+    svg_height = line_count * (font_size + 5) + 20  # ystep + padding
+    return svg_width, svg_height
+
+
+def __getattr__(name):
+    # The formatters live in snippet2image_formatters, imported on first use
+    if name in ('SnippetSvgFormatter', 'SnippetHtmlFormatter'):
+        import snippet2image_formatters
+        return getattr(snippet2image_formatters, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def default_cache_dir():
+    """
+    Directory for snippet2image's on-disk caches.
+
+    Uses $SNIPPET2IMAGE_CACHE_DIR if set, else $XDG_CACHE_HOME/snippet2image,
+    else ~/.cache/snippet2image. Returns None when $SNIPPET2IMAGE_CACHE_DIR
+    is set but empty, which keeps the lexer and style indexes in memory.
+    """
+    cache_dir = os.environ.get('SNIPPET2IMAGE_CACHE_DIR')
+    if cache_dir is not None:
+        return cache_dir or None
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'snippet2image')
+
+
+def _atomic_write(path, data):
+    """
+    Write bytes to a file atomically.
+
+    The data goes to a temporary file in the same directory which then
+    replaces the target, so concurrent readers never see a partial file.
+    """
+    import tempfile
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# Bump when the layout of the lexer index changes
+LEXER_INDEX_FORMAT = 1
+
+
+def build_lexer_index():
+    """
+    Build the filename and MIME type index over every registered lexer.
+
+    File name patterns are split into exact names ('Makefile'), plain
+    extensions ('*.py') and the few remaining globs ('*.[ch]'), so most
+    lookups are dictionary hits instead of an fnmatch over every pattern.
+    Each entry maps to [alias, pattern] pairs; the pattern is kept to rank
+    conflicting candidates the way pygments does.
+    """
+    from pygments.lexers import get_all_lexers
+
+    index = {'format': LEXER_INDEX_FORMAT, 'names': {}, 'extensions': {},
+             'patterns': [], 'mimetypes': {}}
+    for _, aliases, filenames, mimetypes in get_all_lexers(plugins=True):
+        if not aliases:
+            continue
+        alias = aliases[0]
+        for pattern in filenames:
+            if not any(c in pattern for c in '*?['):
+                index['names'].setdefault(pattern, []).append([alias, pattern])
+            elif pattern.startswith('*.') and not any(c in pattern[1:] for c in '*?['):
+                index['extensions'].setdefault(pattern[1:], []).append([alias, pattern])
+            else:
+                index['patterns'].append([alias, pattern])
+        for mimetype in mimetypes:
+            index['mimetypes'].setdefault(mimetype, alias)
+    return index
+
+
+def _load_index(name, index_format, build_index):
+    """
+    Load an index over pygments' registry, building and caching it on disk on first use.
+
+    The cache file is keyed by the pygments version, so upgrading pygments
+    rebuilds it automatically. Without a cache directory (see
+    default_cache_dir()) the index is built in memory only.
+    """
+    cache_dir = default_cache_dir()
+    if cache_dir is None:
+        return build_index()
+    path = os.path.join(cache_dir, f"{name}-{pygments.__version__}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('format') == index_format:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = build_index()
+    try:
+        _atomic_write(path, json.dumps(index).encode('utf-8'))
+    except OSError:
+        pass  # A read-only cache directory only costs us the rebuild next time
+    return index
+
+
+@lru_cache(maxsize=1)
+def load_lexer_index():
+    """Load the lexer index (see build_lexer_index()), cached on disk."""
+    return _load_index('lexer-index', LEXER_INDEX_FORMAT, build_lexer_index)
+
+
+# Bump when the layout of the style index changes
+STYLE_INDEX_FORMAT = 1
+
+
+def build_style_index():
+    """
+    Build the index of style names.
+
+    get_all_styles() looks for plugin styles through the installed packages'
+    entry points, which costs more than the rest of --list-styles together.
+    """
+    from pygments.styles import get_all_styles
+
+    return {'format': STYLE_INDEX_FORMAT, 'styles': sorted(get_all_styles())}
+
+
+@lru_cache(maxsize=1)
+def load_style_index():
+    """Load the style index (see build_style_index()), cached on disk."""
+    return _load_index('style-index', STYLE_INDEX_FORMAT, build_style_index)
+
+
+def lookup_lexer_for_filename(filename, code=None):
+    """
+    Find the lexer alias for a file name using the lexer index.
+
+    Equivalent to pygments' get_lexer_for_filename() without its scan over
+    every lexer: candidates come from dictionary lookups on the name and each
+    of its dotted suffixes. When several lexers claim the name, only those
+    candidates are loaded and ranked (by analyse_text() on the code, or by
+    priority, with a bonus for exact file name patterns).
+
+    Returns:
+        Lexer alias, or None if no lexer matches
+    """
+    index = load_lexer_index()
+    basename = os.path.basename(filename)
+
+    candidates = list(index['names'].get(basename, ()))
+    dot = basename.find('.')
+    while dot != -1:
+        # a.html.j2 is tried as '*.html.j2' and '*.j2'
+        candidates.extend(index['extensions'].get(basename[dot:], ()))
+        dot = basename.find('.', dot + 1)
+    candidates.extend([alias, pattern] for alias, pattern in index['patterns']
+                      if fnmatch.fnmatchcase(basename, pattern))
+
+    if not candidates:
+        return None
+    if len({alias for alias, _ in candidates}) == 1:
+        return candidates[0][0]
+
+    def rating(candidate):
+        alias, pattern = candidate
+        lexer = get_lexer(alias)
+        bonus = 0.5 if '*' not in pattern else 0
+        score = lexer.analyse_text(code) if code else lexer.priority
+        return score + bonus, type(lexer).__name__
+
+    return max(candidates, key=rating)[0]
+
+
+def lookup_lexer_for_mimetype(mimetype):
+    """Find the lexer alias for a MIME type using the lexer index, or None."""
+    return load_lexer_index()['mimetypes'].get(mimetype)
+
+
+@lru_cache(maxsize=64)
+def get_lexer(language):
+    """
+    Get a (cached) lexer instance for a language name or MIME type.
+
+    Lexers are stateless between highlight() calls, so one instance per
+    language is kept warm for the lifetime of the process.
+
+    Raises:
+        ClassNotFound: If no lexer is registered for the language
+    """
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    if '/' in language:
+        alias = lookup_lexer_for_mimetype(language)
+        if alias is None:
+            raise ClassNotFound(f"no lexer for mimetype {language!r}")
+        language = alias
+    return get_lexer_by_name(language, stripall=True)
+
+
+# Language detection
+#
+# Detectors are tried in order; each takes (code, filename) and returns an
+# (alias, confidence) pair or None. The first answer with a confidence of at
+# least DETECTION_THRESHOLD wins. Only when no detector is confident do we fall
+# back to guess_lexer(), which imports and scores every registered lexer.
+
+DETECTION_THRESHOLD = 0.6
+
+# elapsed is the whole detection cost in seconds, setup the part of it spent
+# constructing the lexer
+Detection = namedtuple('Detection', ['lexer', 'method', 'elapsed', 'setup'], defaults=(0.0,))
+
+# Interpreter names (as found in shebangs) that differ from a lexer alias
+INTERPRETER_ALIASES = {
+    'sh': 'bash', 'dash': 'bash', 'ksh': 'bash', 'zsh': 'zsh',
+    'node': 'javascript', 'nodejs': 'javascript', 'deno': 'typescript',
+    'rscript': 'r', 'tclsh': 'tcl', 'wish': 'tcl', 'pwsh': 'powershell',
+    'gawk': 'awk', 'mawk': 'awk', 'runghc': 'haskell', 'escript': 'erlang',
+}
+
+SHEBANG_PATTERN = re.compile(r'#!\s*(\S+)(?:\s+(?:-\S+\s+)*(\S+))?')
+MODELINE_PATTERNS = [
+    re.compile(r'-\*-\s*(?:.*?mode:\s*)?([\w+#-]+)\s*(?:;.*?)?-\*-', re.IGNORECASE),
+    re.compile(r'\b(?:vim?|ex):.*?\b(?:ft|filetype|syntax|syn)=([\w+#-]+)'),
+]
+
+# Keyword classifier: distinctive tokens per language and their weights
+KEYWORD_MODEL = {
+    'python': {'def': 2, 'elif': 3, 'self': 2, 'None': 2, '__init__': 3, '__name__': 3,
+               'import': 1, 'from': 1, 'lambda': 2, 'pass': 2, 'except': 2, 'print': 1,
+               'True': 1, 'False': 1, 'yield': 1, 'isinstance': 2, 'range': 1},
+    'javascript': {'function': 2, 'const': 1, 'let': 1, 'var': 2, '=>': 1, 'console': 3,
+                   'document': 2, 'undefined': 3, 'require': 2, '===': 3, '!==': 3,
+                   'null': 1, 'prototype': 3, 'exports': 2, 'typeof': 2},
+    'typescript': {'interface': 2, 'readonly': 3, 'implements': 1, 'namespace': 1,
+                   'string': 1, 'number': 1, 'boolean': 2, 'enum': 1, '=>': 1, '===': 2,
+                   'const': 1, 'export': 1, 'private': 1, 'unknown': 2, 'keyof': 3},
+    'java': {'public': 1, 'class': 1, 'static': 1, 'void': 1, 'System': 3, 'println': 2,
+             'extends': 1, 'implements': 2, 'package': 2, 'new': 1, 'final': 2,
+             'String': 2, 'throws': 3, 'Override': 3, 'private': 1, 'protected': 2},
+    'c': {'#include': 3, 'int': 1, 'char': 1, 'void': 1, 'printf': 3, 'malloc': 3,
+          'sizeof': 2, 'struct': 2, 'typedef': 2, 'NULL': 2, 'unsigned': 2, '->': 1},
+    'cpp': {'#include': 3, 'std': 3, '::': 2, 'cout': 3, 'template': 3, 'namespace': 2,
+            'class': 1, 'public': 1, 'virtual': 2, 'nullptr': 3, 'auto': 1, 'vector': 2,
+            '->': 1},
+    'csharp': {'using': 2, 'namespace': 2, 'Console': 3, 'WriteLine': 3, 'public': 1,
+               'class': 1, 'static': 1, 'void': 1, 'string': 1, 'var': 1, 'get': 1,
+               'set': 1, 'Task': 2, '=>': 1},
+    'go': {'package': 2, 'func': 3, 'import': 1, 'fmt': 3, ':=': 3, 'chan': 3, 'defer': 3,
+           'go': 1, 'nil': 2, 'struct': 1, 'interface': 1, 'Println': 2, 'err': 2},
+    'rust': {'fn': 3, 'let': 1, 'mut': 3, 'impl': 3, 'pub': 2, 'use': 1, '::': 1,
+             'match': 1, 'Some': 2, 'Ok': 1, 'Err': 2, 'enum': 1, '->': 1, 'println': 2,
+             'crate': 3, 'trait': 2, 'Vec': 2, 'unwrap': 3},
+    'ruby': {'def': 1, 'end': 3, 'puts': 3, 'require': 1, 'module': 1, 'elsif': 3,
+             'unless': 2, 'do': 1, 'attr_accessor': 3, 'nil': 2, 'each': 1},
+    'php': {'<?php': 6, 'echo': 2, 'function': 1, '$': 1, '->': 1, 'array': 2,
+            'public': 1, 'namespace': 1},
+    'bash': {'echo': 2, 'fi': 3, 'then': 2, 'done': 2, 'esac': 3, '$': 1, 'export': 2,
+             'local': 1, 'do': 1, 'grep': 1, 'sudo': 2},
+    'sql': {'SELECT': 3, 'FROM': 1, 'WHERE': 2, 'INSERT': 3, 'INTO': 2, 'UPDATE': 2,
+            'JOIN': 3, 'CREATE': 2, 'TABLE': 2, 'VALUES': 2, 'select': 2, 'where': 1,
+            'join': 2, 'insert': 2, 'values': 1},
+    'html': {'<!DOCTYPE': 4, '<html': 3, '<head': 3, '<body': 3, '<div': 3, '<span': 2,
+             '<script': 2, '<p': 1, '<a': 1, '</': 1},
+    'css': {'color': 2, 'margin': 3, 'padding': 3, 'display': 2, 'px': 2,
+            'background': 2, 'border': 2, 'important': 2, 'em': 1, 'rem': 2},
+}
+
+# Tokens fed to the keyword classifier: identifiers, a few operators and tags.
+# Any $variable collapses into a single '$' token.
+CLASSIFIER_TOKEN_PATTERN = re.compile(
+    r'[A-Za-z_]\w*|<\?php|#include|===|!==|=>|->|::|:=|<!?/?[A-Za-z]*|\$(?=\w)')
+# String literals and comments the classifier skips, so that SQL in a string or
+# prose in a comment doesn't count. '#' only starts a comment before a space,
+# which leaves #include and CSS #ids alone. The lookahead up front lets most
+# positions fail on one character instead of trying every alternative.
+CLASSIFIER_SKIP_PATTERN = re.compile(
+    r'(?=["\'/<`#-])(?:"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|/\*[\s\S]*?\*/|<!--[\s\S]*?-->'
+    r'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`'
+    r'|(?<![:\w])//.*|(?<!\S)(?:#|--)(?=\s|$).*)')
+CLASSIFIER_SAMPLE_SIZE = 64 * 1024
+CLASSIFIER_MIN_SCORE = 4
+
+
+def detect_shebang(code, filename=None):
+    """Detect the language from a '#!' interpreter line."""
+    if not code.startswith('#!'):
+        return None
+    match = SHEBANG_PATTERN.match(code)
+    if not match:
+        return None
+    interpreter = os.path.basename(match.group(1))
+    if interpreter == 'env' and match.group(2):
+        interpreter = match.group(2)
+    # python3.12 -> python, ruby2.7 -> ruby
+    interpreter = re.sub(r'[\d.]+$', '', interpreter.lower())
+    return INTERPRETER_ALIASES.get(interpreter, interpreter), 1.0
+
+
+def detect_modeline(code, filename=None):
+    """Detect the language from an Emacs or Vim modeline near the top or bottom."""
+    lines = code[:4096].splitlines()[:5] + code[-4096:].splitlines()[-5:]
+    for line in lines:
+        for pattern in MODELINE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                return match.group(1).lower(), 1.0
+    return None
+
+
+def detect_filename(code, filename=None):
+    """Detect the language from the input file name."""
+    if not filename:
+        return None
+    alias = lookup_lexer_for_filename(filename, code)
+    return (alias, 0.9) if alias else None
+
+
+def detect_keywords(code, filename=None):
+    """
+    Detect the language with a lightweight keyword classifier.
+
+    Scores each language in KEYWORD_MODEL by the distinctive tokens present in
+    (a sample of) the code, outside string literals and comments. Confidence
+    is the winner's share of the two best scores, so a close call between
+    related languages stays below the threshold.
+
+    Example:
+        >>> detect_keywords('def q(db):\\n    return db.execute("SELECT * FROM t WHERE id = 1")\\n')
+    """
+    sample = CLASSIFIER_SKIP_PATTERN.sub(' ', code[:CLASSIFIER_SAMPLE_SIZE])
+    tokens = set(CLASSIFIER_TOKEN_PATTERN.findall(sample))
+    scores = sorted(
+        ((sum(weight for token, weight in features.items() if token in tokens), alias)
+         for alias, features in KEYWORD_MODEL.items()),
+        reverse=True,
+    )
+    (best, alias), (second, _) = scores[0], scores[1]
+    if best < CLASSIFIER_MIN_SCORE:
+        return None
+    return alias, best / (best + second)
+
+
+DETECTORS = [detect_shebang, detect_modeline, detect_filename, detect_keywords]
+
+
+def register_detector(detector, index=None):
+    """
+    Add a language detector to the detection engine.
+
+    Args:
+        detector: Callable taking (code, filename) and returning an
+            (alias, confidence) pair, or None when it has no opinion
+        index: Position in the detector chain (default: append, i.e. run last)
+    """
+    if index is None:
+        DETECTORS.append(detector)
+    else:
+        DETECTORS.insert(index, detector)
+
+
+def detect_lexer(code, filename=None):
+    """
+    Pick a lexer for code whose language wasn't given.
+
+    Runs the DETECTORS chain (shebang, modeline, file name, keyword classifier)
+    and falls back to pygments' guess_lexer() only when none of them is
+    confident enough.
+
+    Args:
+        code: Source code string
+        filename: Name of the input file, if known
+
+    Returns:
+        Detection(lexer, method, elapsed, setup) where method names the detector
+        that decided, elapsed is the detection cost in seconds and setup the
+        part of it spent constructing the lexer
+    """
+    start = time.perf_counter()
+    # Importing pygments.lexers is part of the first detection's cost
+    from pygments.lexers import guess_lexer
+    from pygments.util import ClassNotFound
+
+    for detector in DETECTORS:
+        result = detector(code, filename)
+        if result is None:
+            continue
+        alias, confidence = result
+        if confidence < DETECTION_THRESHOLD:
+            continue
+        setup_start = time.perf_counter()
+        try:
+            lexer = get_lexer(alias)
+        except ClassNotFound:
+            continue
+        method = detector.__name__.removeprefix('detect_')
+        end = time.perf_counter()
+        return Detection(lexer, method, end - start, end - setup_start)
+
+    return Detection(guess_lexer(code), 'guess', time.perf_counter() - start)
+
+
+class RenderCache:
+    """
+    Content-addressed on-disk cache of rendered SVG/HTML documents.
+
+    Entries are keyed by a hash of the code, every rendering option and the
+    pygments and snippet2image versions, so a hit can be returned without
+    lexing. Entries are written atomically, so several processes can share
+    one cache directory. Reads refresh an entry's modification time, and once
+    the cache grows past max_bytes the least recently used entries are
+    evicted.
+
+    Attributes:
+        hits: Number of lookups answered from the cache by this instance
+        misses: Number of lookups that had to render
+    """
+
+    # Evict down to this fraction of max_bytes so that every write
+    # near the cap doesn't trigger another scan
+    EVICT_TO = 0.9
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Estimated total size, scanned lazily
+
+    @staticmethod
+    def key(code, options):
+        """Hash the code and rendering options into a cache key."""
+        payload = json.dumps({
+            'code': code,
+            'options': options,
+            'pygments': pygments.__version__,
+            'snippet2image': __version__,
+        }, sort_keys=True, default=list)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """
+        Look up a cached render.
+
+        Returns:
+            Tuple of (metadata dict, content), or None on a miss
+        """
+        entry = self._read(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        metadata, content = entry
+        return metadata, content.decode('utf-8')
+
+    def put(self, key, metadata, content):
+        """Store a render, evicting old entries if the cache is over its size cap."""
+        self._write(key, metadata, content.encode('utf-8'))
+
+    def _read(self, key):
+        """Read an entry; returns (metadata dict, payload bytes) or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+                payload = f.read()
+            metadata = json.loads(header)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return metadata, payload
+
+    def _write(self, key, metadata, payload):
+        """Write an entry as a JSON header line followed by the payload bytes."""
+        data = json.dumps(metadata).encode('utf-8') + b'\n' + payload
+        try:
+            _atomic_write(self._path(key), data)
+        except OSError:
+            return  # Caching is best effort
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """List (mtime, size, path) for every entry in the cache."""
+        entries = []
+        try:
+            shards = list(os.scandir(self.directory))
+        except OSError:
+            return entries
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its cap again."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.EVICT_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def stats(self):
+        """One-line summary of this instance's hit/miss counters."""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+
+class TokenStream:
+    """
+    Lexed tokens in compact form.
+
+    Instead of (token type, value) pairs, a stream holds one id per token
+    into a table of token types and the offset at which each token ends in
+    the lexed text. Values are sliced back out of the text on replay, so a
+    stream costs six bytes per token and never duplicates the code.
+
+    Attributes:
+        ttypes: Token types, indexed by id
+        types: Token type id of every token (array of 'H')
+        ends: End offset of every token in the lexed text (array of 'I')
+    """
+
+    __slots__ = ('ttypes', 'types', 'ends')
+
+    def __init__(self, ttypes=(), types=None, ends=None):
+        self.ttypes = list(ttypes)
+        self.types = array('H') if types is None else types
+        self.ends = array('I') if ends is None else ends
+
+    @property
+    def length(self):
+        """Length of the lexed text the stream was recorded from."""
+        return self.ends[-1] if self.ends else 0
+
+    @property
+    def nbytes(self):
+        return (len(self.types) * self.types.itemsize
+                + len(self.ends) * self.ends.itemsize)
+
+    def replay(self, text):
+        """Yield (token type, value) pairs, as the lexer did for text."""
+        ttypes = self.ttypes
+        start = 0
+        for type_id, end in zip(self.types, self.ends):
+            yield ttypes[type_id], text[start:end]
+            start = end
+
+
+class TokenCache:
+    """
+    Cache of lexed token streams, in memory and optionally on disk.
+
+    Streams are keyed by a hash of the code and the lexer (class and
+    preprocessing options), so rendering the same code again with another
+    style, font or size skips lexing entirely. Recently used streams are
+    kept in memory up to memory_bytes; with a directory they are also
+    stored there, laid out and evicted like a RenderCache.
+
+    Attributes:
+        hits: Number of lookups answered from the cache by this instance
+        misses: Number of lookups that had to lex
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024,
+                 memory_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        # The on-disk entries are stored and evicted by a RenderCache
+        self._disk = RenderCache(directory, max_bytes) if directory else None
+        self._memory = {}
+        self._memory_size = 0
+
+    stats = RenderCache.stats
+
+    @staticmethod
+    def key(code, lexer):
+        """Hash the code and the lexer's identity into a cache key."""
+        lexer_class = type(lexer)
+        identity = json.dumps({
+            'lexer': f"{lexer_class.__module__}.{lexer_class.__qualname__}",
+            'stripall': lexer.stripall, 'stripnl': lexer.stripnl,
+            'ensurenl': lexer.ensurenl, 'tabsize': lexer.tabsize,
+            'pygments': pygments.__version__, 'snippet2image': __version__,
+        }, sort_keys=True)
+        digest = hashlib.sha256(identity.encode('utf-8') + b'\n')
+        # Hash the code as is rather than a JSON-escaped copy of it
+        digest.update(code.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def tokens(self, code, lexer, record=True):
+        """
+        Get the tokens of code, replayed from the cache or lexed.
+
+        Args:
+            code: Source code string
+            lexer: Lexer to lex it with on a miss
+            record: On a miss, record the stream and store it once the
+                iterable is exhausted (default: True)
+
+        Returns:
+            Iterable of (token type, value) pairs, like lexer.get_tokens(code)
+        """
+        from pygments.lexer import Lexer
+
+        # Lexers with filters or their own get_tokens() can't be replayed
+        # from the preprocessed text
+        if lexer.filters or type(lexer).get_tokens is not Lexer.get_tokens:
+            return lexer.get_tokens(code)
+        key = self.key(code, lexer)
+        # What get_tokens() does before lexing: newlines, stripping, tabs
+        text = lexer._preprocess_lexer_input(code)
+        stream = self.get(key)
+        if stream is not None and stream.length == len(text):
+            return stream.replay(text)
+        if not record:
+            return ((ttype, value) for _, ttype, value in lexer.get_tokens_unprocessed(text))
+        return self._record(key, lexer, text)
+
+    def _record(self, key, lexer, text):
+        stream = TokenStream()
+        ids = {}
+        types, ends = stream.types, stream.ends
+        # Only cache streams whose values are consecutive slices of the text
+        recording = len(text) < 2 ** 32
+        offset = 0
+        for _, ttype, value in lexer.get_tokens_unprocessed(text):
+            if recording:
+                type_id = ids.get(ttype)
+                if type_id is None:
+                    type_id = ids[ttype] = len(stream.ttypes)
+                    stream.ttypes.append(ttype)
+                recording = type_id < 65536 and text.startswith(value, offset)
+                offset += len(value)
+                types.append(type_id)
+                ends.append(offset)
+            yield ttype, value
+        if recording and offset == len(text):
+            self.put(key, stream)
+
+    def get(self, key):
+        """
+        Look up a token stream, in memory first and then on disk.
+
+        Returns:
+            TokenStream, or None on a miss
+        """
+        stream = self._memory.pop(key, None)
+        if stream is not None:
+            self._memory[key] = stream  # Now the most recently used
+            self.hits += 1
+            return stream
+        entry = self._disk._read(key) if self._disk is not None else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        from pygments.token import string_to_tokentype
+
+        header, payload = entry
+        stream = TokenStream(map(string_to_tokentype, header['ttypes']))
+        split = header['count'] * stream.types.itemsize
+        stream.types.frombytes(payload[:split])
+        stream.ends.frombytes(payload[split:])
+        if sys.byteorder == 'big':
+            # Stored little-endian
+            stream.types.byteswap()
+            stream.ends.byteswap()
+        self._remember(key, stream)
+        return stream
+
+    def put(self, key, stream):
+        """Store a token stream in memory and, with a directory, on disk."""
+        self._remember(key, stream)
+        if self._disk is None:
+            return
+        types, ends = stream.types, stream.ends
+        if sys.byteorder == 'big':
+            types, ends = array('H', types), array('I', ends)
+            types.byteswap()
+            ends.byteswap()
+        header = {'ttypes': [str(ttype) for ttype in stream.ttypes], 'count': len(types)}
+        self._disk._write(key, header, types.tobytes() + ends.tobytes())
+
+    def evict(self):
+        """Delete least recently used streams on disk until they fit the size cap."""
+        if self._disk is not None:
+            self._disk.evict()
+
+    def _remember(self, key, stream):
+        if stream.nbytes > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= old.nbytes
+        self._memory[key] = stream
+        self._memory_size += stream.nbytes
+        while self._memory_size > self.memory_bytes:
+            oldest = self._memory.pop(next(iter(self._memory)))
+            self._memory_size -= oldest.nbytes
+
+
+class RenderResult(namedtuple('RenderResult', [
+        'content', 'format', 'language', 'method', 'width', 'height',
+        'timings', 'cached', 'warnings'])):
+    """
+    Rendered document plus metadata about the render.
+
+    Attributes:
+        content: The SVG or HTML document (None when it was written to a file
+            object instead)
+        format: 'svg' or 'html'
+        language: Name of the lexer the code was highlighted with
+        method: How the lexer was chosen ('explicit', 'shebang', 'guess', ...)
+        width: SVG width in pixels (None for HTML)
+        height: SVG height in pixels (None for HTML)
+        timings: Seconds spent per stage, e.g. {'detect': ..., 'highlight': ...};
+            see TIMING_STAGES
+        cached: Whether the content came from a RenderCache
+        warnings: Messages about the render, e.g. an unknown language
+    """
+
+    __slots__ = ()
+
+    def write(self, file):
+        """Write the content to a text file object."""
+        file.write(self.content)
+
+
+# Ways to style HTML output; see Renderer
+HTML_CSS_MODES = ('inline', 'embedded', 'external')
+
+
+class Renderer:
+    """
+    Reusable renderer for one style, font and background configuration.
+
+    Lexers are memoized per language and formatters per option set, so
+    rendering many snippets with the same configuration pays the setup cost
+    (importing lexer modules, walking the style to build its tables) once
+    instead of once per snippet.
+
+    Example:
+        >>> renderer = Renderer(style='github-dark', font_size=16)
+        >>> result = renderer.render('print("hi")', language='python')
+        >>> result.language
+        'Python'
+    """
+
+    # Highlight sets rarely repeat in large runs; keep this many formatters
+    MAX_FORMATTERS = 64
+
+    def __init__(self, style='monokai', font_name='monospace', font_size=14,
+                 transparent=True, highlight_color='#ffffcc', cache=None,
+                 token_cache=None, dark_style=None, html_css='inline',
+                 compact_svg=False):
+        """
+        Args:
+            style: Pygments style name
+            font_name: Font family for the code
+            font_size: Font size in pixels
+            transparent: Make background transparent (default: True)
+            highlight_color: Background color for highlighted lines
+            dark_style: Pygments style for viewers that prefer a dark color
+                scheme; SVG only (default: a single-theme document)
+            html_css: How HTML is styled: 'inline' style attributes (default,
+                self-contained for draw.io), CSS classes with the stylesheet
+                'embedded' in the document (for a page with a single snippet:
+                each document repeats it), or classes only, for an 'external'
+                stylesheet shared by many documents (see html_stylesheet())
+            compact_svg: Write SVG with merged runs, CSS classes and no
+                redundant markup; renders the same, much smaller (default: False)
+            cache: RenderCache to look up and store results in (default: no cache)
+            token_cache: TokenCache to reuse lexed tokens from, e.g. one shared
+                by renderers for several styles (default: lex every time)
+        """
+        self.style = style
+        self.font_name = font_name
+        self.font_size = font_size
+        self.transparent = transparent
+        self.highlight_color = highlight_color
+        self.dark_style = dark_style
+        if html_css not in HTML_CSS_MODES:
+            raise ValueError(f"Unsupported HTML CSS mode: {html_css}")
+        self.html_css = html_css
+        self.compact_svg = compact_svg
+        self.cache = cache
+        self.token_cache = token_cache
+        self._lexers = {}
+        self._formatters = {}
+
+    def lexer(self, language):
+        """
+        Get the memoized lexer for a language name or MIME type.
+
+        Raises:
+            ClassNotFound: If no lexer is registered for the language
+        """
+        lexer = self._lexers.get(language)
+        if lexer is None:
+            lexer = self._lexers[language] = get_lexer(language)
+        return lexer
+
+    def formatter(self, format_type, highlight_lines=LineRanges()):
+        """
+        Get the memoized formatter for an output format and highlighted lines.
+
+        The formatter for each format is built once. Highlighted lines only
+        change the HTML formatter's hl_lines, so other line sets get a shallow
+        copy that shares the already built style tables.
+        """
+        key = (format_type, highlight_lines)
+        formatter = self._formatters.get(key)
+        if formatter is not None:
+            return formatter
+
+        from snippet2image_formatters import SnippetHtmlFormatter, SnippetSvgFormatter
+
+        if format_type == 'svg':
+            # Create SVG formatter with line numbers, highlights and background
+            formatter = SnippetSvgFormatter(
+                style=self.style,
+                linenos=True,
+                fontfamily=self.font_name,
+                fontsize=f"{self.font_size}px",
+                cssclass="highlight",
+                transparent=self.transparent,
+                highlight_color=self.highlight_color,
+                dark_style=self.dark_style,
+                compact=self.compact_svg,
+            )
+        elif highlight_lines:
+            formatter = copy.copy(self.formatter('html'))
+            # HtmlFormatter only tests membership, so the ranges are used as is
+            formatter.hl_lines = highlight_lines
+        else:
+            # Create HTML formatter with line numbers (no full document for draw.io compatibility)
+            inline = self.html_css == 'inline'
+            formatter = SnippetHtmlFormatter(
+                style=self.style,
+                linenos=True,
+                full=False,  # Generate just the code block, not full HTML document
+                noclasses=inline,  # Inline styles unless a stylesheet is wanted
+                # Scope class rules to the style so several can share a page
+                cssclass='highlight' if inline else f'highlight-{self.style}',
+                embed_stylesheet=self.html_css == 'embedded',
+                fontfamily=self.font_name,
+                fontsize=f"{self.font_size}px",
+                transparent=self.transparent,
+                highlight_color=self.highlight_color,
+            )
+
+        if len(self._formatters) >= self.MAX_FORMATTERS:
+            self._formatters.pop(next(iter(self._formatters)))
+        self._formatters[key] = formatter
+        return formatter
+
+    def render(self, code, format_type='svg', language=None, highlight_lines=None,
+               filename=None, outfile=None, detection=None, record_tokens=None):
+        """
+        Render code to an SVG or HTML string.
+
+        Args:
+            code: Source code string
+            format_type: Output format ('svg' or 'html')
+            language: Programming language (auto-detect if None)
+            highlight_lines: Line numbers to highlight (1-indexed): LineRanges, a
+                list or a range spec string
+            filename: Input file name, used to detect the language when none is given
+            outfile: Text file object to write the document to instead of
+                returning it. Without a cache, tokens are formatted straight into
+                it, so the whole document is never held in memory.
+            detection: Detection to use instead of choosing the lexer again,
+                e.g. when rendering the same code for several targets, or a
+                callable returning one, called only if the render cache misses;
+                its cost is then left out of the timings
+            record_tokens: Store the lexed tokens in the token cache (default:
+                unless streaming, where keeping them would cost the memory
+                streaming saves)
+
+        Returns:
+            RenderResult with the content, the language it was highlighted as
+            and the seconds spent per stage (see RenderResult.timings)
+        """
+        format_type = format_type.lower()
+        if format_type not in ('svg', 'html'):
+            raise ValueError(f"Unsupported format: {format_type}")
+        highlight_lines = LineRanges.coerce(highlight_lines)
+
+        start = time.perf_counter()
+        timings = {}
+        if self.cache is not None:
+            key = self.cache.key(code, {
+                'format': format_type, 'language': language, 'style': self.style,
+                'font_name': self.font_name, 'font_size': self.font_size,
+                'transparent': self.transparent, 'highlight_lines': highlight_lines.to_spec(),
+                'highlight_color': self.highlight_color, 'dark_style': self.dark_style,
+                'html_css': self.html_css, 'compact_svg': self.compact_svg,
+                # The file name only matters when the language has to be detected
+                'filename': None if language or not filename else os.path.basename(filename),
+            })
+            cached = self.cache.get(key)
+            timings['cache'] = time.perf_counter() - start
+            _memory_stage('cache')
+            if cached is not None:
+                metadata, content = cached
+                if outfile is not None:
+                    write_start = time.perf_counter()
+                    outfile.write(content)
+                    content = None
+                    timings['write'] = time.perf_counter() - write_start
+                    _memory_stage('write')
+                timings['total'] = time.perf_counter() - start
+                return RenderResult(content, format_type, metadata['language'],
+                                    metadata['method'], metadata['width'],
+                                    metadata['height'], timings, True, ())
+
+        warnings = []
+        if detection is None:
+            detection = self._detect(code, language, filename, warnings)
+            timings['detect'] = detection.elapsed - detection.setup
+            timings['lexer'] = detection.setup
+            _memory_stage('detect')
+        elif callable(detection):
+            detection = detection()
+        width = height = None
+        # A cached document has to be held in memory anyway, so only stream without one
+        stream = outfile if self.cache is None else None
+        if record_tokens is None:
+            record_tokens = stream is None
+        if format_type == 'svg':
+            content, width, height = self._render_svg(code, detection.lexer, highlight_lines,
+                                                      stream, timings, record_tokens)
+        else:
+            content = self._render_html(code, detection.lexer, highlight_lines, stream, timings,
+                                        record_tokens)
+
+        if self.cache is not None:
+            cache_start = time.perf_counter()
+            self.cache.put(key, {'language': detection.lexer.name, 'method': detection.method,
+                                 'width': width, 'height': height}, content)
+            timings['cache'] += time.perf_counter() - cache_start
+            _memory_stage('cache')
+        if outfile is not None and content is not None:
+            write_start = time.perf_counter()
+            outfile.write(content)
+            content = None
+            timings['write'] = time.perf_counter() - write_start
+            _memory_stage('write')
+        timings['total'] = time.perf_counter() - start
+        return RenderResult(content, format_type, detection.lexer.name, detection.method,
+                            width, height, timings, False, tuple(warnings))
+
+    def _detect(self, code, language, filename, warnings):
+        """Get the lexer for code, detecting the language unless it's given."""
+        from pygments.util import ClassNotFound
+
+        if language:
+            start = time.perf_counter()
+            try:
+                lexer = self.lexer(language)
+                elapsed = time.perf_counter() - start
+                return Detection(lexer, 'explicit', elapsed, elapsed)
+            except ClassNotFound:
+                warnings.append(f"Unknown language '{language}', attempting auto-detection")
+        return detect_lexer(code, filename)
+
+    def stylesheet(self):
+        """CSS for HTML rendered in the 'embedded' or 'external' html_css mode."""
+        return self.formatter('html').stylesheet()
+
+    def tokens(self, code, lexer, record=True):
+        """Lex code, or replay its tokens from the token cache."""
+        if self.token_cache is None:
+            return lexer.get_tokens(code)
+        return self.token_cache.tokens(code, lexer, record)
+
+    def _render_svg(self, code, lexer, highlight_lines, outfile, timings, record_tokens):
+        """Render SVG; returns (content, width, height), content None if streamed."""
+        start = time.perf_counter()
+        # Size the document up front so it's written in a single pass
+        svg_width, svg_height = svg_dimensions(code, self.font_size)
+        # The compact document writes its line numbers ahead of the code
+        line_count = lexed_line_count(code, lexer) if self.compact_svg else None
+        formatter = self.formatter('svg').for_document(svg_width, svg_height, highlight_lines,
+                                                       line_count)
+        highlight_start = time.perf_counter()
+        timings['layout'] = highlight_start - start
+        _memory_stage('layout')
+        content = format_tokens(self.tokens(code, lexer, record_tokens), formatter, outfile)
+        timings['highlight'] = time.perf_counter() - highlight_start
+        _memory_stage('highlight')
+        return content, svg_width, svg_height
+
+    def _render_html(self, code, lexer, highlight_lines, outfile, timings, record_tokens):
+        start = time.perf_counter()
+        # Generate HTML
+        formatter = self.formatter('html', highlight_lines)
+        if outfile is not None:
+            # Count the lines up front so the line numbers don't force buffering
+            formatter = formatter.for_document(lexed_line_count(code, lexer))
+        highlight_start = time.perf_counter()
+        timings['layout'] = highlight_start - start
+        _memory_stage('layout')
+        content = format_tokens(self.tokens(code, lexer, record_tokens), formatter, outfile)
+        timings['highlight'] = time.perf_counter() - highlight_start
+        _memory_stage('highlight')
+        return content
+
+
+@lru_cache(maxsize=16)
+def _shared_renderer(style, font_name, font_size, transparent, highlight_color,
+                     dark_style=None, html_css='inline', compact_svg=False):
+    """Renderer reused by every code_to_image() call with the same configuration."""
+    return Renderer(style=style, font_name=font_name, font_size=font_size,
+                    transparent=transparent, highlight_color=highlight_color,
+                    dark_style=dark_style,
+                    html_css=html_css, compact_svg=compact_svg)
+
+
+def _configured_renderer(style='monokai', font_name='monospace', font_size=14,
+                         transparent=True, highlight_color='#ffffcc', cache=None,
+                         token_cache=None, dark_style=None, html_css='inline',
+                         compact_svg=False):
+    """Shared renderer for a configuration, using the given caches if any."""
+    renderer = _shared_renderer(style, font_name, font_size, transparent, highlight_color,
+                                dark_style, html_css, compact_svg)
+    if cache is not None or token_cache is not None:
+        # Share the memoized lexers and formatters, but use the caller's caches
+        renderer = copy.copy(renderer)
+        renderer.cache = cache
+        renderer.token_cache = token_cache
+    return renderer
+
+
+def render(code, format_type='svg', language=None, style='monokai',
+           font_name='monospace', font_size=14, transparent=True,
+           highlight_lines=None, highlight_color='#ffffcc', filename=None,
+           cache=None, token_cache=None, dark_style=None, html_css='inline',
+           compact_svg=False):
+    """
+    Render code to an SVG or HTML document in memory.
+
+    Prints nothing and writes no output files, which makes it suitable for
+    web services. Filesystem access is limited to the optional caches and,
+    with filename=, the lexer index: it is read from default_cache_dir() and
+    written there on first use, unless $SNIPPET2IMAGE_CACHE_DIR is set to an
+    empty string to keep it in memory. Takes the same rendering
+    options as code_to_image(); renders with the same configuration share
+    their lexers and formatters.
 
-    return svg_content
+    Returns:
+        RenderResult with the content, the language, SVG dimensions and timings
+
+    Example:
+        >>> result = render('print("hi")', language='python')
+        >>> result.language, result.width, result.height
+        ('Python', 208, 39)
+    """
+    renderer = _configured_renderer(style, font_name, font_size, transparent,
+                                    highlight_color, cache, token_cache, dark_style,
+                                    html_css, compact_svg)
+    return renderer.render(code, format_type=format_type, language=language,
+                           highlight_lines=highlight_lines, filename=filename)
+
+
+def html_stylesheet(styles=('monokai',), transparent=True, highlight_color='#ffffcc'):
+    """
+    Build one stylesheet for HTML rendered with html_css='external'.
+
+    Rules are scoped per style, so snippets in all the given styles can
+    share a page that links the stylesheet once.
+
+    Args:
+        styles: Pygments style names (duplicates are ignored)
+        transparent: Make background transparent (default: True)
+        highlight_color: Background color for highlighted lines
+
+    Returns:
+        CSS text
+    """
+    return ''.join(_shared_renderer(style, 'monospace', 14, transparent, highlight_color,
+                                    html_css='external').stylesheet()
+                   for style in dict.fromkeys(styles))
+
+
+def render_to(file, code, format_type='svg', language=None, highlight_lines=None,
+              filename=None, **options):
+    """
+    Render code and write the document to a text file object.
+
+    Takes the same keyword options as render(). Unless a cache is given, the
+    document is streamed: tokens flow from the lexer through the formatter
+    into the file, so memory use doesn't grow with the size of the output.
+
+    Returns:
+        RenderResult describing the render (its content is None)
+    """
+    return _configured_renderer(**options).render(
+        code, format_type=format_type, language=language,
+        highlight_lines=highlight_lines, filename=filename, outfile=file)
+
+
+def render_many(code, targets, language=None, filename=None, **options):
+    """
+    Render code into several documents, detecting and lexing it only once.
+
+    The language is detected for the first target that misses the render
+    cache and the lexed tokens are replayed for the others, so publishing a
+    snippet as light and dark SVG plus HTML costs one lex and three
+    formatting passes, and nothing is detected when every target is cached.
+
+    Args:
+        code: Source code string
+        targets: One dict per document with its render() options, e.g.
+            {'format_type': 'html', 'style': 'vim'}, and optionally 'outfile',
+            a text file object to stream the document into
+        language: Programming language (auto-detect if None)
+        filename: Input file name, used to detect the language when none is given
+        **options: render() options shared by every target
+
+    Returns:
+        List of RenderResult, one per target; each has its own 'layout' and
+        'highlight' timings, and the first one the shared 'detect' and 'lexer'
+
+    Example:
+        >>> results = render_many('print("hi")', [
+        ...     {'style': 'vim'}, {'style': 'monokai'}, {'format_type': 'html'}],
+        ...     language='python')
+        >>> [(result.format, result.language) for result in results]
+        [('svg', 'Python'), ('svg', 'Python'), ('html', 'Python')]
+    """
+    if options.get('token_cache') is None:
+        # Lex for the first target and replay the tokens for the others
+        options['token_cache'] = TokenCache(memory_bytes=float('inf'))
+    detection = None
+    warnings = []
+    results = []
+
+    def detect():
+        # Called by the renders that miss the cache; cache hits know their language
+        nonlocal detection
+        if detection is None:
+            detection = renderer._detect(code, language, filename, warnings)
+        return detection
+
+    for target in targets:
+        target = {**options, **target}
+        outfile = target.pop('outfile', None)
+        format_type = target.pop('format_type', 'svg')
+        highlight_lines = target.pop('highlight_lines', None)
+        renderer = _configured_renderer(**target)
+        # Record the tokens even when streaming, for the targets that follow
+        result = renderer.render(code, format_type=format_type, language=language,
+                                 highlight_lines=highlight_lines, filename=filename,
+                                 outfile=outfile, detection=detection or detect,
+                                 record_tokens=True)
+        results.append(result._replace(warnings=tuple(warnings)))
+    if detection is not None:
+        # Detection happened once; the first result carries its cost
+        timings = results[0].timings
+        timings.update(detect=detection.elapsed - detection.setup, lexer=detection.setup,
+                       total=timings['total'] + detection.elapsed)
+    return results
+
+
+# code_to_image() streams inputs of at least this many characters
+STREAM_THRESHOLD = 1024 * 1024
+
+# Pre-compressed siblings for static hosting: encoding -> suffix added to the path
+PRECOMPRESS_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def _compressor(encoding):
+    """
+    Make a streaming compressor for an encoding.
+
+    Returns:
+        Tuple of (compress(bytes) -> bytes, flush() -> bytes)
+
+    Raises:
+        ValueError: If the encoding is not supported
+        RuntimeError: If brotli is wanted but the brotli package is missing
+    """
+    if encoding == 'gzip':
+        # A gzip header without file name or timestamp, so that unchanged
+        # output compresses to an identical file
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    if encoding == 'br':
+        try:
+            import brotli
+        except ImportError:
+            raise RuntimeError("Brotli compression needs the brotli package "
+                               "(pip install brotli)") from None
+        compressor = brotli.Compressor(quality=11)
+        return compressor.process, compressor.finish
+    raise ValueError(f"Unsupported compression: {encoding}")
+
+
+class OutputFile:
+    """
+    Text file for a rendered document that compresses it on the way to disk.
+
+    A path ending in .svgz is written gzip-compressed. Any other path is
+    written as is, plus a pre-compressed sibling per precompress encoding
+    (path + '.gz' for 'gzip', path + '.br' for 'br'). Siblings are
+    compressed from the same bytes as they are written, so static hosting
+    doesn't need a separate pass that reads every file back.
+
+    Files are created on the first write (or on close), so an OutputFile can
+    be set up ahead of a render that may fail. Every file is written to a
+    temporary file next to it, which replaces it when the OutputFile is
+    closed, keeping the mode of the file it replaces; a symlink's target is
+    replaced, not the link. Leaving the with block with an exception
+    discards them instead, so a failed render never touches existing
+    output. Paths that aren't regular files (/dev/stdout, pipes) are
+    written in place.
+    """
+
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, path, precompress=()):
+        """
+        Args:
+            path: Output file path
+            precompress: Encodings to write siblings in, e.g. ['gzip', 'br']
+                (ignored for .svgz, which is compressed already)
+
+        Raises:
+            ValueError: If an encoding is not supported
+            RuntimeError: If brotli is wanted but the brotli package is missing
+        """
+        if isinstance(precompress, str):
+            precompress = [precompress]
+        if path.lower().endswith('.svgz'):
+            targets = [(path, 'gzip')]
+        else:
+            targets = [(path, None)] + [(path + PRECOMPRESS_SUFFIXES.get(encoding, ''), encoding)
+                                        for encoding in dict.fromkeys(precompress)]
+        # Set up every compressor before creating any file
+        compressors = [_compressor(encoding) if encoding else (None, None)
+                       for _, encoding in targets]
+        self.paths = [target_path for target_path, _ in targets]
+        self._buffer = []
+        self._buffered = 0
+        self._sinks = []
+        self._pending = list(zip(self.paths, compressors))
+
+    def _open(self):
+        """Create the temporary files."""
+        pending, self._pending = self._pending, []
+        try:
+            for target_path, (compress, flush) in pending:
+                # Write through a symlink, as open() would, rather than replace it
+                target_path = os.path.realpath(target_path)
+                tmp_path = self._temporary_path(target_path)
+                file = open(tmp_path or target_path, 'xb' if tmp_path else 'wb')
+                self._sinks.append((file, tmp_path, target_path, compress, flush))
+                if tmp_path and os.path.exists(target_path):
+                    # Keep the permissions of the file being replaced
+                    os.chmod(tmp_path, os.stat(target_path).st_mode & 0o7777)
+        except OSError:
+            self.discard()
+            raise
+
+    @staticmethod
+    def _temporary_path(path):
+        """Temporary path to write path through, or None to write it in place."""
+        if os.path.exists(path) and not os.path.isfile(path):
+            return None
+        directory, name = os.path.split(path)
+        # Like _atomic_write(), but created with open() so that the file gets
+        # the usual permissions rather than mkstemp()'s owner-only ones
+        return os.path.join(directory, f'.tmp-{name}-{os.urandom(6).hex()}')
+
+    def write(self, text):
+        # Formatters write token-sized pieces; compress them in larger blocks
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.BUFFER_SIZE:
+            self._drain()
+        return len(text)
+
+    def _drain(self):
+        if self._pending:
+            self._open()
+        data = ''.join(self._buffer).encode('utf-8')
+        self._buffer = []
+        self._buffered = 0
+        for file, _, _, compress, _ in self._sinks:
+            file.write(compress(data) if compress else data)
+
+    def close(self):
+        """Flush the compressors, close every file and move it into place."""
+        try:
+            if self._pending:
+                self._open()
+            if self._buffer:
+                self._drain()
+            for file, _, _, _, flush in self._sinks:
+                if flush:
+                    file.write(flush())
+                file.close()
+            for _, tmp_path, target_path, _, _ in self._sinks:
+                if tmp_path:
+                    os.replace(tmp_path, target_path)
+        except BaseException:
+            self.discard()
+            raise
+        self._sinks = []
+
+    def discard(self):
+        """Close every file and delete what was written, leaving existing files as they were."""
+        for file, tmp_path, _, _, _ in self._sinks:
+            file.close()
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass  # Already moved into place
+        self._sinks = []
+        self._pending = []
+        self._buffer = []
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
 
 
 def code_to_image(code, output_file, format_type='svg', language=None,
                   style='monokai', font_name='monospace', font_size=14,
-                  transparent=True, highlight_lines=None, highlight_color='#ffffcc'):
+                  transparent=True, highlight_lines=None, highlight_color='#ffffcc',
+                  filename=None, cache=None, token_cache=None, stream=None,
+                  dark_style=None, html_css='inline', compact_svg=False, precompress=(),
+                  verbose=True):
     """
     Convert code snippet to SVG or HTML with syntax highlighting and line numbers.
 
     Args:
         code: Source code string
-        output_file: Output file path
+        output_file: Output file path; a .svgz path is written gzip-compressed
         format_type: Output format ('svg' or 'html')
         language: Programming language (auto-detect if None)
         style: Pygments style name
         font_name: Font family for the code
         font_size: Font size in pixels
         transparent: Make background transparent (default: True)
-        highlight_lines: List of line numbers to highlight (1-indexed)
+        highlight_lines: Line numbers to highlight (1-indexed): LineRanges, a list
+            or a range spec string
         highlight_color: Background color for highlighted lines (default: '#ffffcc')
+        filename: Input file name, used to detect the language when none is given
+        cache: RenderCache to look up and store the result in (default: no cache)
+        token_cache: TokenCache to reuse lexed tokens from (default: lex every time)
+        stream: Write the document to the file while it's formatted instead of
+            building it in memory first (default: for inputs of STREAM_THRESHOLD
+            characters or more, when no cache is used)
+        dark_style: Pygments style used when the viewer prefers a dark color
+            scheme, making a single SVG that follows it (default: style only)
+        html_css: HTML styling: 'inline' (default), 'embedded' or 'external'
+            (see Renderer)
+        compact_svg: Write a compact SVG that renders the same (see Renderer)
+        precompress: Also write pre-compressed copies next to the file, e.g.
+            ['gzip', 'br'] for output.svg.gz and output.svg.br (see OutputFile)
+        verbose: Print a short report after saving (default: True)
+
+    Returns:
+        RenderResult describing the render; its timings include the 'write'
+        stage (see TIMING_STAGES)
     """
-    # Get lexer for syntax highlighting
-    if language:
-        try:
-            lexer = get_lexer_by_name(language, stripall=True)
-        except ClassNotFound:
-            print(f"Warning: Unknown language '{language}', attempting auto-detection")
-            lexer = guess_lexer(code)
+    options = dict(
+        format_type=format_type, language=language, style=style,
+        font_name=font_name, font_size=font_size, transparent=transparent,
+        highlight_lines=highlight_lines, highlight_color=highlight_color,
+        filename=filename, cache=cache, token_cache=token_cache, dark_style=dark_style,
+        html_css=html_css, compact_svg=compact_svg)
+    if stream is None:
+        stream = cache is None and len(code) >= STREAM_THRESHOLD
+
+    start = time.perf_counter()
+    if stream:
+        renderer = _configured_renderer(style, font_name, font_size, transparent,
+                                        highlight_color, cache, token_cache, dark_style,
+                                        html_css, compact_svg)
+        # Set up the formatter, and with it the styles, before creating any
+        # file, so a bad option fails without leaving even a temporary file
+        if format_type.lower() in ('svg', 'html'):
+            renderer.formatter(format_type.lower())
+        setup = time.perf_counter() - start
+        # A failed render discards the partial output (see OutputFile)
+        with OutputFile(output_file, precompress) as f:
+            result = renderer.render(code, format_type=format_type, language=language,
+                                     highlight_lines=highlight_lines, filename=filename,
+                                     outfile=f)
+        result.timings['layout'] = result.timings.get('layout', 0.0) + setup
+        result.timings['total'] += setup
     else:
-        lexer = guess_lexer(code)
-
-    if format_type.lower() == 'svg':
-        # Create SVG formatter with line numbers and transparent background
-        formatter = SvgFormatter(
-            style=style,
-            linenos=True,
-            fontfamily=font_name,
-            fontsize=f"{font_size}px",
-            cssclass="highlight"
-        )
-
-        # Generate SVG
-        content = highlight(code, lexer, formatter)
-
-        # Add width, height, and viewBox for proper display in image viewers
-        line_count = len(code.split('\n'))
-        longest_line = max(len(line) for line in code.split('\n'))
-
-        # Calculate width based on code content
-        # For monospace fonts: char_width ≈ 0.6 * font_size
-        # Line numbers are at x=76, so: line_number_area + (chars * char_width) + padding
-        char_width = font_size * 0.6
-        svg_width = 76 + int(longest_line * char_width) + 40  # line numbers + code + right padding
-        svg_height = line_count * (font_size + 5) + 20  # ystep + padding
-
-        content = content.replace(
-            '<svg xmlns="http://www.w3.org/2000/svg">',
-            f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">'
-        )
-
-        # Add line highlights if specified
-        if highlight_lines:
-            content = add_svg_highlights(content, highlight_lines, highlight_color)
-
-        # Remove background from SVG (make transparent) if requested
-        if transparent:
-            content = content.replace('background: #', 'background: transparent; /* #')
-
-    elif format_type.lower() == 'html':
-        # Create HTML formatter with line numbers (no full document for draw.io compatibility)
-        formatter = HtmlFormatter(
-            style=style,
-            linenos=True,
-            full=False,  # Generate just the code block, not full HTML document
-            noclasses=True,  # Use inline styles instead of CSS classes
-            fontfamily=font_name,
-            fontsize=f"{font_size}px",
-            hl_lines=highlight_lines if highlight_lines else [],  # Add line highlighting
-        )
+        result = render(code, **options)
+        # Write to file
+        with OutputFile(output_file, precompress) as f:
+            result.write(f)
+    _memory_stage('write')
+    # Whatever render() didn't time was spent opening, writing and closing files
+    timings = result.timings
+    elapsed = time.perf_counter() - start
+    timings['write'] = timings.get('write', 0.0) + elapsed - timings['total']
+    timings['total'] = elapsed
+
+    if verbose:
+        for warning in result.warnings:
+            print(f"Warning: {warning}")
+        print(f"{format_type.upper()} saved to: {output_file}")
+        if len(f.paths) > 1:
+            print(f"Pre-compressed: {', '.join(f.paths[1:])}")
+        if result.cached:
+            print(f"Language: {result.language} (from cache)")
+        else:
+            detect = result.timings['detect'] + result.timings['lexer']
+            print(f"Language: {result.language} "
+                  f"(detected by {result.method} in {detect * 1000:.2f} ms)")
+        print(f"Style: {style}" + (f" (dark: {dark_style})" if dark_style else ''))
 
-        # Generate HTML
-        content = highlight(code, lexer, formatter)
-
-        # Fix line number alignment by adding matching line-height to line numbers
-        # The code section has line-height: 125%, so line numbers need the same
-        content = re.sub(
-            r'(<td class="linenos">.*?<pre)>',
-            r'\1 style="line-height: 125%;">',
-            content,
-            flags=re.DOTALL
-        )
-
-        # Apply custom highlight color if lines are highlighted
-        if highlight_lines and highlight_color:
-            # Replace the default highlight color with custom color
-            # Pygments uses inline style "background-color: <color>" for highlighted lines
-            content = re.sub(
-                r'(<span[^>]*style="[^"]*?)background-color:\s*#[0-9a-fA-F]+',
-                rf'\1background-color: {highlight_color}',
-                content
-            )
+    return result
 
-        # Make background transparent by replacing background color styles if requested
-        # But preserve highlight colors
-        if transparent:
-            if highlight_lines:
-                # Replace background colors but NOT in highlighted line spans
-                # More precise: only replace on container divs and tables, not on highlight spans
-                content = re.sub(
-                    r'(<(?:div|table|td)[^>]*style="[^"]*?)background:\s*#[0-9a-fA-F]+',
-                    r'\1background: transparent',
-                    content
-                )
+
+def code_to_images(code, targets, language=None, filename=None, verbose=True, **options):
+    """
+    Convert a code snippet into several files, detecting and lexing it once.
+
+    Args:
+        code: Source code string
+        targets: One dict per output file with its 'output' path and its own
+            code_to_image() options, e.g. {'output': 'dark.svg', 'style': 'monokai'}.
+            Without a 'format_type' the format follows the file extension.
+        language: Programming language (auto-detect if None)
+        filename: Input file name, used to detect the language when none is given
+        verbose: Print a short report with a line per file (default: True)
+        **options: code_to_image() options shared by every target
+
+    Returns:
+        List of RenderResult, one per target
+    """
+    options.pop('stream', None)  # Every target is streamed into its file
+    precompress = options.pop('precompress', ())
+    outputs = [target['output'] for target in targets]
+    # Files are only created once their target's render writes to them, and
+    # replace the existing ones when every target has rendered; if any target
+    # fails, every output is left as it was (see OutputFile)
+    with contextlib.ExitStack() as stack:
+        render_targets = []
+        for target in targets:
+            target = dict(target)
+            output_file = target.pop('output')
+            if not target.get('format_type'):
+                target['format_type'] = (options.get('format_type')
+                                         or detect_format(output_file, verbose))
+            target['outfile'] = stack.enter_context(OutputFile(output_file, precompress))
+            render_targets.append(target)
+        compressed = [path for target in render_targets for path in target['outfile'].paths[1:]]
+        results = render_many(code, render_targets, language=language, filename=filename,
+                              **options)
+    _memory_stage('write')
+
+    if verbose:
+        for warning in results[0].warnings:
+            print(f"Warning: {warning}")
+        if all(result.cached for result in results):
+            print(f"Language: {results[0].language} (from cache)")
+        else:
+            detect = results[0].timings['detect'] + results[0].timings['lexer']
+            print(f"Language: {results[0].language} (detected by {results[0].method} "
+                  f"in {detect * 1000:.2f} ms)")
+        for target, output_file, result in zip(targets, outputs, results):
+            style = target.get('style') or options.get('style', 'monokai')
+            dark_style = target.get('dark_style', options.get('dark_style'))
+            if dark_style and result.format == 'svg':
+                style += f", dark: {dark_style}"
+            if result.cached:
+                timing = 'from cache'
             else:
-                content = re.sub(r'background:\s*#[0-9a-fA-F]+', 'background: transparent', content)
+                timing = f"{result.timings['highlight'] * 1000:.2f} ms"
+            print(f"{result.format.upper()} saved to: {output_file} (style: {style}, {timing})")
+        if compressed:
+            print(f"Pre-compressed: {', '.join(compressed)}")
+
+    return results
+
+
+# Stages in RenderResult.timings, in pipeline order, with what each one covers
+TIMING_STAGES = {
+    'args': 'parsing the command line',
+    'read': 'reading the input',
+    'cache': 'render cache lookup and store',
+    'detect': 'choosing the language',
+    'lexer': 'constructing the lexer',
+    'layout': 'sizing the document, setting up the formatter',
+    'highlight': 'lexing and formatting (and writing, if streamed)',
+    'write': 'writing and compressing the output files',
+    'total': 'the whole render',
+}
+
+
+def sum_timings(timings_list):
+    """Add up the per-stage timings of several renders."""
+    total = {}
+    for timings in timings_list:
+        for stage, seconds in timings.items():
+            total[stage] = total.get(stage, 0.0) + seconds
+    return total
+
+
+def format_timings(columns, as_json=False):
+    """
+    Format per-stage timings for --timings.
 
-    else:
-        raise ValueError(f"Unsupported format: {format_type}")
+    Args:
+        columns: {label: timings in seconds}, e.g. one entry per output file
+        as_json: Return JSON in seconds instead of a table in milliseconds
+
+    Returns:
+        The table or JSON document
+
+    Example:
+        >>> print(format_timings({'out.svg': {'detect': 0.0012, 'total': 0.0042}}))
+        stage         out.svg
+        detect        1.20 ms  choosing the language
+        total         4.20 ms  the whole render
+    """
+    stages = [stage for stage in TIMING_STAGES
+              if any(stage in timings for timings in columns.values())]
+    stages += sorted({stage for timings in columns.values() for stage in timings} - set(stages))
+    if as_json:
+        return json.dumps({label: {stage: timings[stage] for stage in stages if stage in timings}
+                           for label, timings in columns.items()}, indent=2)
+
+    widths = [max(len(label), 8) for label in columns]
+    lines = ['stage     ' + ' '.join(f'{label:>{width + 3}}'
+                                     for label, width in zip(columns, widths))]
+    for stage in stages:
+        cells = [f"{timings[stage] * 1000:>{width}.2f} ms" if stage in timings else ' ' * (width + 3)
+                 for timings, width in zip(columns.values(), widths)]
+        lines.append(f"{stage:<10}" + ' '.join(cells) + f"  {TIMING_STAGES.get(stage, '')}")
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+class Profile:
+    """
+    Context manager profiling the code it wraps with cProfile and a stack sampler.
+
+    cProfile counts calls and time per function; a sampler thread records
+    the wrapped thread's whole stack every switch interval, which shows
+    which caller a hot function (often a lexer's regex) was reached from.
+    With a path, PATH.pstats (for pstats or snakeviz) and PATH.folded
+    (folded stacks for flamegraph.pl or speedscope) are written on exit.
+
+    Example:
+        >>> with Profile(top=5):  # doctest: +SKIP
+        ...     render(code)
+    """
+
+    def __init__(self, path=None, top=0):
+        """
+        Args:
+            path: Base path of the output files; a .pstats suffix is optional
+                (default: None, write no files)
+            top: Print this many of the functions with the most own time to
+                stderr on exit (default: 0, none)
+        """
+        self.path = path.removesuffix('.pstats') if path else None
+        self.top = top
+        self.stacks = {}
+        self._profiler = None
+        self._sampler = None
+        self._stop = threading.Event()
+
+    @property
+    def paths(self):
+        """The .pstats and .folded paths written on exit."""
+        return [f'{self.path}.pstats', f'{self.path}.folded'] if self.path else []
+
+    def __enter__(self):
+        import cProfile
+
+        if self.path:
+            self._sampler = threading.Thread(target=self._sample, daemon=True,
+                                             args=(threading.get_ident(),))
+            self._sampler.start()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        import pstats
+
+        self._profiler.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        if self.path:
+            self._profiler.dump_stats(self.paths[0])
+            with open(self.paths[1], 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            samples = sum(self.stacks.values())
+            print(f"Profile saved to: {', '.join(self.paths)} ({samples} samples)",
+                  file=sys.stderr)
+        if self.top:
+            pstats.Stats(self._profiler, stream=sys.stderr).sort_stats(
+                'tottime').print_stats(self.top)
+
+    def _sample(self, thread_id):
+        """Count the profiled thread's stacks until stopped."""
+        interval = sys.getswitchinterval()
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                              f"{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                stack = ';'.join(reversed(frames))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
 
-    # Write to file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
 
-    print(f"{format_type.upper()} saved to: {output_file}")
-    print(f"Language: {lexer.name}")
-    print(f"Style: {style}")
+# The MemoryTrace that renders in this process report their stages to, if any
+_memory_trace = None
+
+
+def _memory_stage(stage):
+    """Attribute the traced memory peak since the previous stage to stage."""
+    if _memory_trace is not None:
+        _memory_trace.stage(stage)
+
+
+class MemoryTrace:
+    """
+    Context manager tracing the memory of the renders it wraps with tracemalloc.
+
+    While it is active, renders report where their stages end (see
+    TIMING_STAGES; 'detect' includes constructing the lexer), so report()
+    can tell how much memory each stage needed on top of what was in use
+    when it began. It also lists the sites that held the most memory at the
+    fullest stage boundary, and the process's peak RSS. Tracing slows
+    rendering down several times, so it is opt-in.
+
+    Example:
+        >>> with MemoryTrace() as trace:  # doctest: +SKIP
+        ...     code_to_image(code, 'out.svg', verbose=False)
+        >>> trace.report()['stages']  # doctest: +SKIP
+        {'cache': 0, 'detect': 1180, 'layout': 5322, 'highlight': 912044, 'write': 388100}
+    """
+
+    def __init__(self, top=10):
+        """
+        Args:
+            top: Number of allocation sites to report (default: 10)
+        """
+        self.top = top
+        self.stages = {}
+        self.peak = 0
+        self._baseline = 0
+        self._stage_start = 0
+        self._started = False
+        self._start_snapshot = None
+        self._snapshot = None
+        self._snapshot_size = -1
+        self._previous = None
+
+    def __enter__(self):
+        global _memory_trace
+        import tracemalloc
+
+        if tracemalloc.is_tracing():
+            # Only count what is allocated from here on
+            self._start_snapshot = tracemalloc.take_snapshot()
+        else:
+            tracemalloc.start()
+            self._started = True
+        self._baseline = self._stage_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._previous, _memory_trace = _memory_trace, self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _memory_trace
+        import tracemalloc
+
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - self._baseline)
+        _memory_trace = self._previous
+        if self._started:
+            tracemalloc.stop()
+
+    def stage(self, stage):
+        """Record the peak since the previous stage (or the start) as stage's."""
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages[stage] = max(self.stages.get(stage, 0), peak - self._stage_start)
+        self.peak = max(self.peak, peak - self._baseline)
+        self._stage_start = current
+        if self.top and current > self._snapshot_size:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+        tracemalloc.reset_peak()
+
+    def report(self):
+        """
+        Summarize the trace.
+
+        Returns:
+            Dict with 'stages' ({stage: peak bytes above the memory in use
+            when the stage began}), 'peak' (bytes above the memory in use when
+            the trace began), 'top' (a list of {'site', 'size', 'count'}
+            for the allocation sites holding the most memory, in bytes) and
+            'peak_rss' (process peak RSS in bytes, None where unsupported)
+        """
+        top = []
+        if self._snapshot is not None:
+            import tracemalloc
+
+            snapshot = self._snapshot.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)])
+            if self._start_snapshot is not None:
+                statistics = snapshot.compare_to(self._start_snapshot, 'lineno')
+                top = [(stat.traceback[0], stat.size_diff, stat.count_diff)
+                       for stat in statistics if stat.size_diff > 0]
+            else:
+                top = [(stat.traceback[0], stat.size, stat.count)
+                       for stat in snapshot.statistics('lineno')]
+        return {
+            'stages': {stage: self.stages[stage] for stage in TIMING_STAGES
+                       if stage in self.stages},
+            'peak': self.peak,
+            'top': [{'site': f"{frame.filename}:{frame.lineno}", 'size': size, 'count': count}
+                    for frame, size, count in top[:self.top]],
+            'peak_rss': peak_rss(),
+        }
+
+
+def format_memory(report, as_json=False):
+    """
+    Format a MemoryTrace report for --memory.
+
+    Args:
+        report: MemoryTrace.report() dict
+        as_json: Return JSON in bytes instead of a table in MB
+
+    Returns:
+        The table or JSON document
+    """
+    if as_json:
+        return json.dumps(report, indent=2)
+    lines = ['stage     peak growth']
+    for stage, size in report['stages'].items():
+        lines.append(f"{stage:<10} {size / 1024 / 1024:>8.2f} MB  {TIMING_STAGES[stage]}")
+    lines.append(f"{'peak':<10} {report['peak'] / 1024 / 1024:>8.2f} MB")
+    if report['peak_rss'] is not None:
+        lines.append(f"{'RSS':<10} {report['peak_rss'] / 1024 / 1024:>8.2f} MB  "
+                     f"peak resident set size of the process")
+    if report['top']:
+        lines.append('top allocation sites at the fullest stage boundary:')
+        for site in report['top']:
+            lines.append(f"  {site['size'] / 1024:>9.1f} KB {site['count']:>8} blocks  "
+                         f"{site['site']}")
+    return '\n'.join(lines)
+
+
+def write_stylesheet(path, styles, defaults):
+    """
+    Write the shared stylesheet for HTML rendered with html_css='external'.
+
+    Args:
+        path: Stylesheet path
+        styles: Pygments style names used by the run (duplicates are ignored)
+        defaults: Default code_to_image() keyword arguments of the run
+    """
+    css = html_stylesheet(styles, transparent=defaults['transparent'],
+                          highlight_color=defaults['highlight_color'])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(css)
 
 
 def list_styles():
     """List all available Pygments styles."""
-    styles = sorted(get_all_styles())
+    styles = load_style_index()['styles']
     print(f"Available styles ({len(styles)} total):")
     print()
     for i, style in enumerate(styles, 1):
@@ -263,7 +2155,789 @@ def list_styles():
     print("Preview styles at: https://pygments.org/demo/")
 
 
+def detect_format(output_file, verbose=True):
+    """
+    Determine the output format from the output file extension.
+
+    Args:
+        output_file: Output file path
+        verbose: Warn when the extension is not recognized (default: True)
+
+    Returns:
+        'svg' or 'html'
+    """
+    _, ext = os.path.splitext(output_file)
+    if ext.lower() == '.html':
+        return 'html'
+    if ext.lower() in ('.svg', '.svgz'):
+        return 'svg'
+    if verbose:
+        print("Warning: Unknown extension, defaulting to SVG")
+    return 'svg'
+
+
+# Manifest keys accepted in batch mode, mapped to code_to_image() arguments
+MANIFEST_OPTIONS = {
+    'format': 'format_type',
+    'language': 'language',
+    'style': 'style',
+    'font': 'font_name',
+    'font_size': 'font_size',
+    'highlight_lines': 'highlight_lines',
+    'highlight_color': 'highlight_color',
+    'dark_style': 'dark_style',
+    'html_css': 'html_css',
+    'compact_svg': 'compact_svg',
+    'precompress': 'precompress',
+    'filename': 'filename',
+}
+
+
+# Per-target keys accepted after "-o PATH:", mapped to code_to_image() arguments
+TARGET_OPTIONS = {key: arg for key, arg in MANIFEST_OPTIONS.items()
+                  if key not in ('language', 'filename', 'precompress')}
+
+
+def parse_output_target(spec):
+    """
+    Parse an -o argument: a path, optionally followed by per-target options.
+
+    Options follow the last colon as comma-separated key=value pairs, with
+    the keys of a batch manifest entry (except language, filename and precompress).
+
+    Returns:
+        Dict with the 'output' path and code_to_image() keyword arguments
+
+    Raises:
+        ValueError: If an option is unknown or has an invalid value
+
+    Example:
+        >>> parse_output_target('dark.svg:style=monokai,font_size=16')
+        {'output': 'dark.svg', 'style': 'monokai', 'font_size': 16}
+    """
+    path, sep, overrides = spec.rpartition(':')
+    if not sep or '=' not in overrides:
+        return {'output': spec}
+
+    target = {'output': path}
+    for item in overrides.split(','):
+        key, sep, value = (part.strip() for part in item.partition('='))
+        if key == 'opaque_background':
+            target['transparent'] = value.lower() not in ('1', 'true', 'yes')
+        elif sep and key in TARGET_OPTIONS:
+            target[TARGET_OPTIONS[key]] = value
+        else:
+            raise ValueError(f"Unknown output option '{key}' in '{spec}'")
+
+    if target.get('format_type', 'svg').lower() not in ('svg', 'html'):
+        raise ValueError(f"Unsupported format in '{spec}': {target['format_type']}")
+    if 'font_size' in target:
+        target['font_size'] = int(target['font_size'])
+    if 'highlight_lines' in target:
+        target['highlight_lines'] = parse_line_ranges(target['highlight_lines'])
+    if 'compact_svg' in target:
+        target['compact_svg'] = target['compact_svg'].lower() in ('1', 'true', 'yes')
+    return target
+
+
+def load_manifest(manifest_file):
+    """
+    Load a batch manifest.
+
+    The manifest is a JSON Lines file: one object per line with an ``input``
+    and an ``output`` path plus optional per-item overrides (``format``,
+    ``language``, ``style``, ``font``, ``font_size``, ``opaque_background``,
+    ``highlight_lines``, ``highlight_color``, ``dark_style``, ``html_css``,
+    ``compact_svg``, ``precompress``, ``filename``). Blank lines and lines starting with ``#`` are ignored.
+
+    Args:
+        manifest_file: Manifest path, or '-' to read from stdin
+
+    Returns:
+        List of manifest entries (dicts)
+    """
+    if manifest_file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    entries = []
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid manifest line {line_num}: {e}")
+        if not isinstance(entry, dict) or 'input' not in entry or 'output' not in entry:
+            raise ValueError(f"Invalid manifest line {line_num}: "
+                             f"expected an object with 'input' and 'output'")
+        entries.append(entry)
+    return entries
+
+
+def _parse_flag(key, value):
+    """Convert a manifest flag: a JSON boolean or '1'/'true'/'yes'/'0'/'false'/'no'."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('1', 'true', 'yes', '0', 'false', 'no'):
+        return value.lower() in ('1', 'true', 'yes')
+    raise ValueError(f"'{key}' must be true or false, got {value!r}")
+
+
+def entry_overrides(entry):
+    """
+    Check and convert a manifest entry's overrides to code_to_image() arguments.
+
+    Values are converted the way parse_output_target() converts per-target
+    options, so "16" works as a font size just like 16.
+
+    Returns:
+        Dict of code_to_image() keyword arguments
+
+    Raises:
+        ValueError: If a value has the wrong type, naming its key
+
+    Example:
+        >>> entry_overrides({'input': 'a.py', 'font_size': '16', 'compact_svg': True})
+        {'font_size': 16, 'compact_svg': True}
+        >>> entry_overrides({'font_size': 'x'})
+        Traceback (most recent call last):
+        ...
+        ValueError: 'font_size' must be an integer, got 'x'
+    """
+    overrides = {}
+    for key, arg in MANIFEST_OPTIONS.items():
+        if key not in entry:
+            continue
+        value = entry[key]
+        if key == 'font_size':
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(f"'font_size' must be an integer, got {value!r}")
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"'font_size' must be an integer, got {value!r}") from None
+        elif key == 'compact_svg':
+            value = _parse_flag(key, value)
+        elif key == 'precompress':
+            if isinstance(value, str):
+                value = [value]
+            if (not isinstance(value, list)
+                    or not all(encoding in PRECOMPRESS_SUFFIXES for encoding in value)):
+                raise ValueError(f"'precompress' must be a list of "
+                                 f"{', '.join(PRECOMPRESS_SUFFIXES)}, got {value!r}")
+        elif key == 'highlight_lines':
+            if not (isinstance(value, str) or value is None or (
+                    isinstance(value, list)
+                    and all(isinstance(line, int) and not isinstance(line, bool)
+                            for line in value))):
+                raise ValueError(f"'highlight_lines' must be a range spec or a list of "
+                                 f"line numbers, got {value!r}")
+            try:
+                value = LineRanges.coerce(value)
+            except ValueError as e:
+                raise ValueError(f"'highlight_lines': {e}") from None
+        elif value is not None and not isinstance(value, str):
+            raise ValueError(f"'{key}' must be a string, got {value!r}")
+        elif key == 'format' and value is not None and value.lower() not in ('svg', 'html'):
+            raise ValueError(f"'format' must be svg or html, got {value!r}")
+        elif key == 'html_css' and value not in HTML_CSS_MODES:
+            raise ValueError(f"'html_css' must be one of {', '.join(HTML_CSS_MODES)}, "
+                             f"got {value!r}")
+        overrides[arg] = value
+    if 'opaque_background' in entry:
+        overrides['transparent'] = not _parse_flag('opaque_background',
+                                                   entry['opaque_background'])
+    return overrides
+
+
+# Options that HTML in html_css='external' mode leaves to the shared stylesheet
+STYLESHEET_OPTIONS = {'highlight_color': 'highlight_color', 'opaque_background': 'transparent'}
+
+
+def check_stylesheet_options(options, defaults):
+    """
+    Reject per-item options that a shared stylesheet can't honour.
+
+    HTML rendered with html_css='external' only carries CSS classes, and the
+    stylesheet is built from the run's defaults, so an item with its own
+    highlight color or background would silently get the run's.
+
+    Args:
+        options: The item's code_to_image() keyword arguments, format resolved
+        defaults: Default code_to_image() keyword arguments of the run
+
+    Raises:
+        ValueError: If such an option differs from the run's, naming its key
+    """
+    if options.get('html_css') != 'external' or options.get('format_type', '').lower() != 'html':
+        return
+    for key, arg in STYLESHEET_OPTIONS.items():
+        if options.get(arg, defaults[arg]) != defaults[arg]:
+            raise ValueError(f"'{key}' can't be set per item for HTML with an external "
+                             f"stylesheet, which uses the run's")
+
+
+def _entry_options(entry, defaults):
+    """Merge a manifest entry's overrides into the default rendering options."""
+    options = dict(defaults)
+    options.update(entry_overrides(entry))
+    if options.get('token_cache') is None:
+        # Batches and servers often render the same code again in another style
+        options['token_cache'] = _process_token_cache()
+    return options
+
+
+@lru_cache(maxsize=1)
+def _process_token_cache():
+    """In-memory TokenCache shared by the batch items and server requests of a process."""
+    return TokenCache()
+
+
+def render_job(entry, defaults):
+    """
+    Render a single batch item.
+
+    Args:
+        entry: Manifest entry with 'input' (or inline 'code'), 'output' and
+            optional overrides
+        defaults: Default code_to_image() keyword arguments for this batch
+
+    Returns:
+        RenderResult describing the render
+    """
+    options = _entry_options(entry, defaults)
+
+    start = time.perf_counter()
+    if 'code' in entry:
+        code = entry['code']
+    else:
+        with open(entry['input'], 'r', encoding='utf-8') as f:
+            code = f.read()
+        options.setdefault('filename', entry['input'])
+    read = time.perf_counter() - start
+    _memory_stage('read')
+    if not NON_WHITESPACE_PATTERN.search(code):
+        raise ValueError("No code provided")
+
+    if not options.get('format_type'):
+        options['format_type'] = detect_format(entry['output'], verbose=False)
+    check_stylesheet_options(options, defaults)
+
+    result = code_to_image(code=code, output_file=entry['output'],
+                           verbose=False, **options)
+    result.timings['read'] = read
+    result.timings['total'] += read
+    return result
+
+
+def _run_job(entry, defaults, memory=False):
+    """
+    Render a batch item, capturing failures instead of raising.
+
+    Args:
+        entry: Manifest entry
+        defaults: Default code_to_image() keyword arguments for this batch
+        memory: Trace the item's memory (default: False)
+
+    Returns:
+        Tuple of (RenderResult without its content, error message,
+        MemoryTrace report or None); exactly one of the first two is None
+    """
+    trace = MemoryTrace() if memory else contextlib.nullcontext()
+    with trace:
+        try:
+            # The content is already on disk; don't ship it back from a worker
+            result, error = render_job(entry, defaults)._replace(content=None), None
+        except Exception as e:
+            result, error = None, str(e)
+    return result, error, trace.report() if memory else None
+
+
+def _pool_results(entries, defaults, workers, memory=False):
+    """
+    Run batch items on a pool of worker processes.
+
+    Only `workers` items are in flight at a time, so when a worker dies (say,
+    killed for running out of memory) just the items on the broken pool are
+    lost. They are reported as failed and the rest go on in a fresh pool.
+
+    Yields:
+        _run_job() result tuples in manifest order
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = iter(enumerate(entries))
+    running = {}
+    results = {}
+    next_index = 0
+    try:
+        while next_index < len(entries):
+            for index, entry in itertools.islice(pending, workers - len(running)):
+                running[executor.submit(_run_job, entry, defaults, memory)] = index
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in finished):
+                # Every item in flight goes down with the pool
+                finished = list(running)
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=workers)
+            for future in finished:
+                index = running.pop(future)
+                try:
+                    results[index] = future.result()
+                except BrokenProcessPool:
+                    results[index] = (None, "a worker process died while this item "
+                                            "was in flight", None)
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def run_batch(entries, defaults, jobs=1, timings=None, memory=None):
+    """
+    Render every manifest entry, reporting each item.
+
+    With jobs > 1 the items are spread over a pool of worker processes. Each
+    worker keeps its lexers and formatters warm across items, and results are
+    reported in manifest order regardless of which worker finishes first.
+    A failing item is reported on stderr and does not stop the run, and
+    neither does a worker process dying (see _pool_results()).
+
+    Args:
+        entries: Manifest entries as returned by load_manifest()
+        defaults: Default code_to_image() keyword arguments for this batch
+        jobs: Number of worker processes (default: 1, render in this process)
+        timings: Print the stage timings summed over the items to stderr,
+            as 'table' or 'json' (default: None, don't)
+        memory: Trace every item's memory and print a report line per item
+            to stderr, as 'table' or 'json' (default: None, don't)
+
+    Returns:
+        Number of failed items
+    """
+    if jobs > 1 and len(entries) > 1:
+        results = _pool_results(entries, defaults, min(jobs, len(entries)), bool(memory))
+    else:
+        results = (_run_job(entry, defaults, bool(memory)) for entry in entries)
+    failed, cache_hits, total = _report_batch(entries, results, memory)
+
+    print(f"Batch complete: {len(entries) - failed} succeeded, {failed} failed")
+    if defaults.get('cache') is not None:
+        # Workers have their own RenderCache copies, so count hits from the results
+        print(f"Cache: {cache_hits} hits, {len(entries) - failed - cache_hits} misses")
+    if timings:
+        # Summed over the items, so with jobs > 1 this is CPU time rather than wall time
+        print(format_timings({f'{len(entries) - failed} items': total},
+                             as_json=timings == 'json'), file=sys.stderr)
+    return failed
+
+
+def _report_batch(entries, results, memory=None):
+    """
+    Print one status line per batch item, and one memory line with memory
+    ('table' or 'json').
+
+    Returns:
+        Tuple of (number of failures, number of cache hits, stage timings
+        summed over the successful items)
+    """
+    failed = cache_hits = 0
+    timings = []
+    for entry, (result, error, report) in zip(entries, results):
+        if error is not None:
+            failed += 1
+            print(f"FAILED {entry['input']}: {error}", file=sys.stderr)
+        else:
+            cache_hits += result.cached
+            timings.append(result.timings)
+            cached = ', cached' if result.cached else ''
+            print(f"OK {entry['input']} -> {entry['output']} ({result.language}{cached})")
+        if report is None:
+            continue
+        if memory == 'json':
+            print(json.dumps({'input': entry['input'], 'output': entry['output'], **report}),
+                  file=sys.stderr)
+        else:
+            stages = ', '.join(f"{stage} {size / 1024 / 1024:.1f}"
+                               for stage, size in report['stages'].items())
+            rss = (f", RSS {report['peak_rss'] / 1024 / 1024:.0f} MB"
+                   if report['peak_rss'] is not None else '')
+            print(f"MEMORY {entry['input']}: peak {report['peak'] / 1024 / 1024:.1f} MB "
+                  f"({stages}){rss}", file=sys.stderr)
+    return failed, cache_hits, sum_timings(timings)
+
+
+def default_socket_path():
+    """Default Unix socket path for the render server (per user)."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'snippet2image.sock')
+    return f"/tmp/snippet2image-{os.getuid()}.sock"
+
+
+class _RenderRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle render requests on one connection.
+
+    The protocol is newline-delimited JSON: each request line is a manifest
+    entry (see load_manifest(); inline 'code' may replace 'input'), and each
+    response line is {"ok": true, "language": ...} or {"ok": false, "error": ...}.
+    A connection may carry any number of requests.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict) or 'output' not in entry:
+                    raise ValueError("expected an object with 'output'")
+                if 'code' not in entry and 'input' not in entry:
+                    raise ValueError("expected 'input' or 'code'")
+                # Formatters are shared between connections, so render one at a time
+                with self.server.render_lock:
+                    result = render_job(entry, self.server.defaults)
+                response = {'ok': True, 'language': result.language,
+                            'output': entry['output'], 'cached': result.cached}
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-lived render server listening on a Unix domain socket."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, defaults):
+        self.defaults = defaults
+        self.render_lock = threading.Lock()
+        super().__init__(socket_path, _RenderRequestHandler)
+
+
+def _warm_up(defaults):
+    """Import every lexer module and build the default formatters up front."""
+    from pygments.lexers import guess_lexer
+
+    guess_lexer('import os\n')
+    renderer = _shared_renderer(defaults['style'], defaults['font_name'],
+                                defaults['font_size'], defaults['transparent'],
+                                defaults['highlight_color'], defaults['dark_style'],
+                                defaults['html_css'], defaults['compact_svg'])
+    for format_type in ('svg', 'html'):
+        renderer.formatter(format_type)
+
+
+def serve(socket_path, defaults):
+    """
+    Run the render server until interrupted.
+
+    Pygments, the lexers and the default formatters are loaded once at startup,
+    so each request only pays for the render itself. Use
+    snippet2image_client.py (which imports nothing heavy) to talk to it.
+
+    Args:
+        socket_path: Path of the Unix socket to listen on
+        defaults: Default code_to_image() keyword arguments for every request
+    """
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # Stale socket left behind by a server that didn't shut down cleanly
+            os.unlink(socket_path)
+        else:
+            raise RuntimeError(f"A server is already listening on {socket_path}")
+        finally:
+            probe.close()
+
+    _warm_up(defaults)
+    old_umask = os.umask(0o077)  # Socket is only accessible by this user
+    try:
+        server = RenderServer(socket_path, defaults)
+    finally:
+        os.umask(old_umask)
+
+    # Treat SIGTERM like Ctrl+C so the socket file is cleaned up
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {socket_path} (Ctrl+C to stop)")
+    try:
+        with server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# Largest request body accepted by the HTTP service
+HTTP_MAX_BODY = 10 * 1024 * 1024
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+}
+
+
+def _init_http_worker(defaults):
+    """Process pool initializer for the HTTP service."""
+    # A forked worker inherits the event loop's signal wakeup fd; without this
+    # the SIGTERM that retires a worker would also reach the service's loop
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _warm_up(defaults)
+
+
+def _render_http_request(request, defaults):
+    """
+    Process pool entry point for the HTTP service.
+
+    Args:
+        request: Decoded JSON body with 'code' and optional manifest overrides
+        defaults: Default rendering options for every request
+
+    Returns:
+        RenderResult
+    """
+    options = _entry_options(request, defaults)
+    options['format_type'] = (options.get('format_type') or 'svg').lower()
+    options.pop('precompress', None)  # Responses aren't written to disk
+    check_stylesheet_options(options, defaults)
+
+    return render(request['code'], **options)
+
+
+class HttpRenderService:
+    """
+    Asyncio HTTP front end over a bounded process pool.
+
+    POST /render takes a JSON body with 'code' plus optional overrides (the
+    batch manifest keys) and returns the SVG or HTML document. At most
+    `workers` renders run at once and `queue_depth` more may wait; further
+    requests are turned away with 429 straight away. A request that doesn't
+    finish within `timeout` seconds gets 503. Its render still occupies the
+    pool until it completes, so the slot is only released then. If a worker
+    dies (say, killed for running out of memory), the requests it took down
+    get 503 and the pool is replaced.
+    """
+
+    def __init__(self, defaults, workers=1, queue_depth=64, timeout=10.0):
+        self.defaults = defaults
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self.timeout = timeout
+        self.pending = 0
+        self.pool = None
+
+    async def serve(self, host, port):
+        """Start the pool and serve HTTP until cancelled."""
+        import asyncio
+
+        # Treat SIGTERM like Ctrl+C so the worker pool is shut down
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel)
+        self.pool = self._start_pool()
+        try:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+            print(f"Listening on http://{host}:{port} "
+                  f"({self.workers} workers, queue depth {self.capacity - self.workers})")
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _start_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_init_http_worker, initargs=(self.defaults,))
+
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload, extra = await self._dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write_response(writer, status, content_type, payload, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except _HttpError as e:
+            self._write_response(writer, e.status, 'text/plain; charset=utf-8',
+                                 str(e).encode('utf-8'), {}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Read one request; returns None when the client closed the connection."""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise _HttpError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise _HttpError(400, "Invalid Content-Length")
+        if length > HTTP_MAX_BODY:
+            raise _HttpError(413, f"Request body exceeds {HTTP_MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _dispatch(self, method, path, body):
+        """Route a request; returns (status, content type, payload, extra headers)."""
+        import asyncio
+
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            stats = {'pending': self.pending, 'capacity': self.capacity}
+            return 200, 'application/json', json.dumps(stats).encode('utf-8'), {}
+        if path not in ('/', '/render'):
+            return 404, 'text/plain; charset=utf-8', b'Not found', {}
+        if method != 'POST':
+            return 405, 'text/plain; charset=utf-8', b'Use POST', {'Allow': 'POST'}
+
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict) or not isinstance(request.get('code'), str):
+                raise ValueError("expected a JSON object with 'code'")
+            entry_overrides(request)  # Reject bad values before taking a slot
+        except ValueError as e:
+            return 400, 'text/plain; charset=utf-8', f"Invalid request: {e}".encode('utf-8'), {}
+
+        # Backpressure: refuse work up front rather than queueing without bound
+        if self.pending >= self.capacity:
+            return (429, 'text/plain; charset=utf-8', b'Render queue is full',
+                    {'Retry-After': '1'})
+
+        self.pending += 1
+        pool = self.pool
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                pool, _render_http_request, request, self.defaults)
+        except Exception as e:
+            # Submitting to a broken pool raises here, before there's a future to release the slot
+            self.pending -= 1
+            return self._failure(pool, e)
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return (503, 'text/plain; charset=utf-8', b'Render timed out',
+                    {'Retry-After': '1'})
+        except Exception as e:
+            return self._failure(pool, e)
+
+        return (200, CONTENT_TYPES[result.format], result.content.encode('utf-8'),
+                {'X-Snippet2image-Language': result.language,
+                 'X-Snippet2image-Cache': 'hit' if result.cached else 'miss'})
+
+    def _failure(self, pool, error):
+        """Response for a failed render; replaces the pool if a worker died."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        if isinstance(error, BrokenProcessPool):
+            # Every request on the broken pool fails; only the first replaces it
+            if self.pool is pool:
+                print(f"Warning: a render worker died ({error}); restarting the pool",
+                      file=sys.stderr)
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._start_pool()
+            return (503, 'text/plain; charset=utf-8', b'Render worker died',
+                    {'Retry-After': '1'})
+        # Unknown languages and styles are ValueErrors too (pygments' ClassNotFound)
+        status = 400 if isinstance(error, ValueError) else 500
+        return status, 'text/plain; charset=utf-8', f"Error: {error}".encode('utf-8'), {}
+
+    def _release(self, future):
+        self.pending -= 1
+        if not future.cancelled():
+            future.exception()  # Mark exceptions of abandoned renders as retrieved
+
+    @staticmethod
+    def _write_response(writer, status, content_type, payload, extra, keep_alive):
+        lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in extra.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+
+
+class _HttpError(Exception):
+    """Protocol error that ends the connection with the given status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def serve_http(address, defaults, workers=1, queue_depth=64, timeout=10.0):
+    """
+    Run the HTTP render service until interrupted.
+
+    Args:
+        address: '[HOST:]PORT' to listen on (host defaults to 127.0.0.1)
+        defaults: Default rendering options for every request
+        workers: Size of the render process pool
+        queue_depth: Requests allowed to wait for a worker before getting 429
+        timeout: Seconds before a request gets 503
+    """
+    import asyncio
+
+    host, _, port = address.rpartition(':')
+    service = HttpRenderService(defaults, workers=workers,
+                                queue_depth=queue_depth, timeout=timeout)
+    try:
+        asyncio.run(service.serve(host or '127.0.0.1', int(port)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
 def main():
+    start = time.perf_counter()
+    if sys.argv[1:2] == ['bench']:
+        # The benchmark suite has its own options; see snippet2image_bench
+        from snippet2image_bench import main as bench_main
+        bench_main(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser(
         description='Convert code snippets to SVG or HTML with syntax highlighting and line numbers',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -281,6 +2955,19 @@ Examples:
   # Generate with opaque background
   python snippet2image.py -i script.py -o output.svg --opaque-background
 
+  # Many HTML snippets sharing one stylesheet instead of inline styles
+  python snippet2image.py --inputs-from manifest.jsonl --stylesheet snippets.css
+
+  # One SVG that follows the viewer's light or dark color scheme
+  python snippet2image.py -i script.py -o output.svg -s default --dark-style monokai
+
+  # A much smaller SVG for long listings
+  python snippet2image.py -i long_module.py -o output.svg --compact-svg
+
+  # Compressed SVG, or plain files with gzip siblings for static hosting
+  python snippet2image.py -i script.py -o output.svgz
+  python snippet2image.py --inputs-from manifest.jsonl --precompress gzip
+
   # Highlight specific lines (8 and 9)
   python snippet2image.py -i script.py -o output.svg --highlight-lines "8 9"
 
@@ -293,6 +2980,50 @@ Examples:
   # Auto-detect format from extension
   python snippet2image.py -i script.js -o output.svg
 
+  # Light and dark SVG plus an HTML fallback, reading and lexing the input once
+  python snippet2image.py -i script.py -o light.svg:style=vim -o dark.svg:style=monokai -o page.html
+
+  # Batch mode: render every item of a JSON Lines manifest in one process
+  # (each line: {"input": "a.py", "output": "a.svg", "style": "vim"})
+  python snippet2image.py --inputs-from manifest.jsonl -s github-dark
+
+  # Render the same file in several styles, lexing it only once
+  python snippet2image.py -i script.py -o light.svg -s vim --token-cache
+  python snippet2image.py -i script.py -o dark.svg -s monokai --token-cache
+
+  # Stream a very large file to the output without buffering the document
+  python snippet2image.py -i huge.py -o output.html --stream
+
+  # Where does the time go? Per-stage timings, or JSON for scripts
+  python snippet2image.py -i script.py -o output.svg --timings
+  python snippet2image.py -i script.py -o output.svg --timings json
+
+  # Why is this file slow? Profile it, print the hottest functions and
+  # render a flame graph from the folded stacks
+  python snippet2image.py -i slow.rb -o output.svg --profile slow --profile-top 15
+  flamegraph.pl slow.folded > slow-flame.svg
+
+  # Which stage needs the memory? Traced peaks per stage, per item in batch mode
+  python snippet2image.py -i huge.py -o output.svg --memory
+  python snippet2image.py --inputs-from manifest.jsonl --memory json 2> memory.jsonl
+
+  # Reuse earlier renders of identical input from the on-disk cache
+  python snippet2image.py -i script.py -o output.svg --cache
+
+  # Batch mode spread over 8 worker processes
+  python snippet2image.py --inputs-from manifest.jsonl --jobs 8
+
+  # Benchmark on the bundled corpus and compare against a saved baseline
+  python snippet2image.py bench --baseline bench.json
+
+  # Keep a warm render server running and talk to it with the light client
+  python snippet2image.py --serve &
+  python snippet2image_client.py -i script.py -o output.svg
+
+  # Serve rendering over HTTP with 8 worker processes
+  python snippet2image.py --serve-http 127.0.0.1:8080 --jobs 8
+  curl -d '{"code": "print(1)", "language": "python"}' localhost:8080/render
+
 Popular styles: monokai, github-dark, dracula, one-dark, vim, solarized-dark, etc.
 Preview styles at: https://pygments.org/demo/
         """
@@ -300,14 +3031,34 @@ Preview styles at: https://pygments.org/demo/
 
     parser.add_argument('-i', '--input', type=str,
                        help='Input file (if not provided, reads from stdin)')
-    parser.add_argument('-o', '--output', type=str,
-                       help='Output file path (.svg or .html)')
+    parser.add_argument('-o', '--output', type=str, action='append', metavar='OUTPUT[:KEY=VALUE,...]',
+                       help='Output file path (.svg, .svgz or .html); repeat to render several files '
+                            'from one read and lex, each with its own options, e.g. '
+                            '-o dark.svg:style=monokai')
     parser.add_argument('-f', '--format', type=str, choices=['svg', 'html'],
                        help='Output format (auto-detect from extension if not specified)')
     parser.add_argument('-l', '--language', type=str,
                        help='Programming language (auto-detect if not specified)')
     parser.add_argument('-s', '--style', type=str, default='monokai',
                        help='Pygments style name (default: monokai)')
+    parser.add_argument('--dark-style', type=str, metavar='STYLE',
+                       help='SVG: also embed this style for viewers that prefer a dark color '
+                            'scheme (tokens get CSS classes; one file follows both themes)')
+    parser.add_argument('--html-css', choices=HTML_CSS_MODES, default='inline',
+                       help='HTML: inline style attributes (default, self-contained for draw.io), '
+                            'CSS classes with the stylesheet embedded in each document (for '
+                            'a page with a single snippet), or '
+                            'classes only, for an external stylesheet')
+    parser.add_argument('--precompress', nargs='+', choices=list(PRECOMPRESS_SUFFIXES),
+                       default=[], metavar='ENCODING',
+                       help='Also write pre-compressed copies next to each output: '
+                            'gzip (.gz) and/or br (.br, needs the brotli package)')
+    parser.add_argument('--compact-svg', action='store_true',
+                       help='SVG: merge runs, use CSS classes and drop redundant markup '
+                            '(renders the same, much smaller)')
+    parser.add_argument('--stylesheet', type=str, metavar='PATH',
+                       help='HTML: write one shared stylesheet for every style used in the run '
+                            'to PATH and leave it out of the documents (implies --html-css external)')
     parser.add_argument('--font', type=str, default='monospace',
                        help='Font family (default: monospace)')
     parser.add_argument('--font-size', type=int, default=14,
@@ -315,76 +3066,263 @@ Preview styles at: https://pygments.org/demo/
     parser.add_argument('--opaque-background', action='store_true',
                        help='Use opaque background instead of transparent (default: transparent)')
     parser.add_argument('--highlight-lines', type=str,
-                       help='Lines to highlight (space-separated, supports ranges like "8-10 15 20-22")')
+                       help='Lines to highlight (space-separated, supports ranges like "8-10 15 20-22" and "100-")')
     parser.add_argument('--highlight-color', type=str, default='#ffffcc',
                        help='Background color for highlighted lines (default: #ffffcc - light yellow)')
     parser.add_argument('--list-styles', action='store_true',
                        help='List all available styles and exit')
+    parser.add_argument('--profile', type=str, metavar='PATH',
+                       help='Profile the render (single and batch modes) and write cProfile '
+                            'stats to PATH.pstats and folded stacks for flame graphs to '
+                            'PATH.folded; batches run in this process')
+    parser.add_argument('--profile-top', type=int, default=0, metavar='N',
+                       help='Print the N functions with the most own time to stderr '
+                            '(with or without --profile)')
+    parser.add_argument('--memory', nargs='?', choices=['table', 'json'], const='table',
+                       help='Trace memory and print the traced peak per stage, the top '
+                            'allocation sites and the peak RSS to stderr, as a table (default) '
+                            'or JSON; per item in batch mode. Slows rendering down')
+    parser.add_argument('--timings', nargs='?', choices=['table', 'json'], const='table',
+                       help='Print the time spent per stage (argument parsing, reading, '
+                            'detection, lexing and formatting, writing) to stderr, '
+                            'as a table (default) or JSON')
+    cache_dir = default_cache_dir()
+    parser.add_argument('--cache', type=str, nargs='?',
+                       const=os.path.join(cache_dir, 'renders') if cache_dir else '', metavar='DIR',
+                       help='Cache rendered output on disk and reuse it for identical renders '
+                            f'(default: {os.path.join(cache_dir, "renders") if cache_dir else "none"})')
+    parser.add_argument('--token-cache', type=str, nargs='?',
+                       const=os.path.join(cache_dir, 'tokens') if cache_dir else '', metavar='DIR',
+                       help='Keep lexed tokens on disk so re-rendering the same code in another '
+                            'style, font or size skips lexing '
+                            f'(default: {os.path.join(cache_dir, "tokens") if cache_dir else "none"})')
+    parser.add_argument('--cache-max-size', type=int, default=256, metavar='MB',
+                       help='Size cap of the render and token caches in MB (default: 256 each)')
+    parser.add_argument('--stream', action='store_true',
+                       help='Write the output while it is formatted instead of building it '
+                            'in memory first (automatic for inputs over 1 MiB without --cache)')
+    parser.add_argument('--inputs-from', type=str, metavar='MANIFEST',
+                       help='Batch mode: render every item of a JSON Lines manifest '
+                            '("-" for stdin); other options act as per-item defaults')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of worker processes for batch mode (default: 1)')
+    parser.add_argument('--serve', type=str, nargs='?', const=default_socket_path(),
+                       metavar='SOCKET',
+                       help='Run a render server on a Unix socket '
+                            f'(default: {default_socket_path()}); other options act as defaults')
+    parser.add_argument('--serve-http', type=str, metavar='[HOST:]PORT',
+                       help='Run an HTTP render service (POST /render) using --jobs workers; '
+                            'other options act as defaults')
+    parser.add_argument('--queue-depth', type=int, default=64,
+                       help='HTTP service: requests that may wait for a worker '
+                            'before getting 429 (default: 64)')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                       help='HTTP service: seconds before a request gets 503 (default: 10)')
 
     args = parser.parse_args()
+    args_time = time.perf_counter() - start
+    # Without a default cache directory --cache and --token-cache need a DIR
+    if args.cache == '' or args.token_cache == '':
+        parser.error('--cache and --token-cache need a DIR when $SNIPPET2IMAGE_CACHE_DIR is empty')
 
     # Handle --list-styles
     if args.list_styles:
         list_styles()
         sys.exit(0)
 
+    # Parse highlight lines if provided
+    highlight_lines = None
+    if args.highlight_lines:
+        try:
+            highlight_lines = parse_line_ranges(args.highlight_lines)
+        except ValueError as e:
+            print(f"Error parsing highlight lines: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    # Options shared by every item in batch and server modes
+    defaults = {
+        'format_type': args.format,
+        'language': args.language,
+        'style': args.style,
+        'font_name': args.font,
+        'font_size': args.font_size,
+        'transparent': not args.opaque_background,
+        'highlight_lines': highlight_lines,
+        'highlight_color': args.highlight_color,
+        'dark_style': args.dark_style,
+        # A shared stylesheet means the HTML must not carry one
+        'html_css': 'external' if args.stylesheet else args.html_css,
+        'compact_svg': args.compact_svg,
+        'precompress': args.precompress,
+        'cache': RenderCache(args.cache, args.cache_max_size * 1024 * 1024) if args.cache else None,
+        'token_cache': (TokenCache(args.token_cache, args.cache_max_size * 1024 * 1024)
+                        if args.token_cache else None),
+    }
+
+    profile = (Profile(args.profile, args.profile_top)
+               if args.profile or args.profile_top else contextlib.nullcontext())
+
+    # Handle server mode
+    if args.serve:
+        try:
+            if args.stylesheet:
+                write_stylesheet(args.stylesheet, [args.style], defaults)
+            serve(args.serve, defaults)
+        except (OSError, RuntimeError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.serve_http:
+        try:
+            if args.stylesheet:
+                write_stylesheet(args.stylesheet, [args.style], defaults)
+            serve_http(args.serve_http, defaults, workers=max(1, args.jobs),
+                       queue_depth=max(0, args.queue_depth), timeout=args.timeout)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    # Handle batch mode
+    if args.inputs_from:
+        try:
+            entries = load_manifest(args.inputs_from)
+        except (OSError, ValueError) as e:
+            print(f"Error reading manifest: {e}", file=sys.stderr)
+            sys.exit(1)
+        if args.stylesheet:
+            # One stylesheet for the whole batch, covering every style it uses
+            styles = [args.style] + [entry['style'] for entry in entries if 'style' in entry]
+            try:
+                write_stylesheet(args.stylesheet, styles, defaults)
+            except OSError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            print(f"Stylesheet saved to: {args.stylesheet}")
+        jobs = max(1, args.jobs)
+        if (args.profile or args.profile_top) and jobs > 1:
+            print("Warning: profiling renders the batch in this process; ignoring --jobs",
+                  file=sys.stderr)
+            jobs = 1
+        with profile:
+            failed = run_batch(entries, defaults, jobs=jobs, timings=args.timings,
+                               memory=args.memory)
+        sys.exit(1 if failed else 0)
+
     # Validate output is required
     if not args.output:
         parser.error('the following arguments are required: -o/--output')
+    try:
+        targets = [parse_output_target(spec) for spec in args.output]
+    except ValueError as e:
+        parser.error(str(e))
+    # One plain -o is the classic single-file mode
+    single = len(targets) == 1 and len(targets[0]) == 1
 
     # Determine format
     if args.format:
         format_type = args.format
-    else:
+    elif single:
         # Auto-detect from file extension
-        _, ext = os.path.splitext(args.output)
-        if ext.lower() == '.html':
-            format_type = 'html'
-        elif ext.lower() == '.svg':
-            format_type = 'svg'
-        else:
-            print("Warning: Unknown extension, defaulting to SVG")
-            format_type = 'svg'
-
-    # Read input
-    if args.input:
-        with open(args.input, 'r', encoding='utf-8') as f:
-            code = f.read()
+        format_type = detect_format(targets[0]['output'])
     else:
-        if sys.stdin.isatty():
-            print("Enter your code (press Ctrl+D when finished):")
-        code = sys.stdin.read()
-
-    if not code.strip():
-        print("Error: No code provided", file=sys.stderr)
-        sys.exit(1)
-
-    # Parse highlight lines if provided
-    highlight_lines = None
-    if args.highlight_lines:
+        format_type = None  # Per target, from its extension
+    if args.dark_style and single and format_type != 'svg':
+        print("Warning: --dark-style only applies to SVG output; ignoring it")
+    for target in targets:
+        options = {**defaults, **target,
+                   'format_type': (target.get('format_type') or format_type
+                                   or detect_format(target['output'], verbose=False))}
         try:
-            highlight_lines = parse_line_ranges(args.highlight_lines)
+            check_stylesheet_options(options, defaults)
         except ValueError as e:
-            print(f"Error parsing highlight lines: {e}", file=sys.stderr)
-            sys.exit(1)
+            parser.error(f"{target['output']}: {e}")
 
-    # Convert to specified format
+    trace = MemoryTrace() if args.memory else contextlib.nullcontext()
     try:
-        code_to_image(
-            code=code,
-            output_file=args.output,
-            format_type=format_type,
-            language=args.language,
-            style=args.style,
-            font_name=args.font,
-            font_size=args.font_size,
-            transparent=not args.opaque_background,
-            highlight_lines=highlight_lines,
-            highlight_color=args.highlight_color
-        )
+        with trace:
+            # Read input
+            read_start = time.perf_counter()
+            if args.input:
+                with open(args.input, 'r', encoding='utf-8') as f:
+                    code = f.read()
+            else:
+                if sys.stdin.isatty():
+                    print("Enter your code (press Ctrl+D when finished):")
+                code = sys.stdin.read()
+            read_time = time.perf_counter() - read_start
+            _memory_stage('read')
+
+            # Avoid strip(), which would copy a large input
+            if not NON_WHITESPACE_PATTERN.search(code):
+                print("Error: No code provided", file=sys.stderr)
+                sys.exit(1)
+
+            # Convert to specified format
+            if args.stylesheet:
+                styles = [args.style] + [target['style'] for target in targets if 'style' in target]
+                write_stylesheet(args.stylesheet, styles, defaults)
+                print(f"Stylesheet saved to: {args.stylesheet}")
+            with profile:
+                if single:
+                    results = [code_to_image(
+                        code=code,
+                        output_file=targets[0]['output'],
+                        format_type=format_type,
+                        language=args.language,
+                        style=args.style,
+                        font_name=args.font,
+                        font_size=args.font_size,
+                        transparent=not args.opaque_background,
+                        highlight_lines=highlight_lines,
+                        highlight_color=args.highlight_color,
+                        dark_style=args.dark_style,
+                        html_css=defaults['html_css'],
+                        compact_svg=args.compact_svg,
+                        precompress=args.precompress,
+                        filename=args.input,
+                        cache=defaults['cache'],
+                        token_cache=defaults['token_cache'],
+                        stream=args.stream or None
+                    )]
+                else:
+                    results = code_to_images(
+                        code, targets,
+                        format_type=format_type,
+                        language=args.language,
+                        style=args.style,
+                        font_name=args.font,
+                        font_size=args.font_size,
+                        transparent=not args.opaque_background,
+                        highlight_lines=highlight_lines,
+                        highlight_color=args.highlight_color,
+                        dark_style=args.dark_style,
+                        html_css=defaults['html_css'],
+                        compact_svg=args.compact_svg,
+                        precompress=args.precompress,
+                        filename=args.input,
+                        cache=defaults['cache'],
+                        token_cache=defaults['token_cache']
+                    )
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        # Also report the memory of a failed or empty run
+        if args.memory:
+            print(format_memory(trace.report(), as_json=args.memory == 'json'),
+                  file=sys.stderr)
+
+    if args.timings:
+        # The first output carries the stages shared by every output
+        timings = results[0].timings
+        timings['args'] = args_time
+        timings['read'] = read_time
+        timings['total'] = time.perf_counter() - start
+        print(format_timings({target['output']: result.timings
+                              for target, result in zip(targets, results)},
+                             as_json=args.timings == 'json'), file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+snippet2image_bench - Benchmark suite for snippet2image.
+
+Renders a bundled synthetic corpus (a dozen languages, each as a tiny,
+medium and huge file, with heavy highlight specs) to SVG and HTML through
+code_to_image(), and reports throughput, latency percentiles per size and
+peak memory. Results can be saved as a JSON baseline and later runs
+compared against it; a metric that gets worse by more than the threshold
+is a regression, and the run exits with status 1.
+
+Usage:
+    snippet2image bench [--save-baseline bench.json]
+    snippet2image bench --baseline bench.json [--threshold 10]
+    python snippet2image_bench.py --sizes tiny medium --formats svg
+"""
+
+import sys
+import argparse
+import json
+import math
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import pygments
+
+from snippet2image import code_to_image, peak_rss
+
+# One small, idiomatic sample per language; larger files repeat it.
+# Keyed by file extension, which is how the language gets detected.
+SAMPLES = {
+    'py': '''\
+import asyncio
+from dataclasses import dataclass
+
+
+@dataclass
+class Job:
+    """A unit of work with a retry budget."""
+    name: str
+    retries: int = 3
+
+    async def run(self, queue: asyncio.Queue) -> str:
+        for attempt in range(self.retries):
+            if await queue.get() == self.name:
+                return f"{self.name} done after {attempt + 1} tries"
+        raise TimeoutError(self.name)
+''',
+    'js': '''\
+// Debounce a callback and fetch results as the user types
+const debounce = (fn, ms = 200) => {
+  let timer;
+  return (...args) => {
+    clearTimeout(timer);
+    timer = setTimeout(() => fn(...args), ms);
+  };
+};
+
+export async function search(query) {
+  const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+  if (!response.ok) throw new Error(`HTTP ${response.status}`);
+  return (await response.json()).items.map(({ id, title }) => ({ id, title }));
+}
+''',
+    'ts': '''\
+interface Repository<T extends { id: number }> {
+  find(id: number): Promise<T | undefined>;
+  save(item: T): Promise<void>;
+}
+
+export class MemoryRepository<T extends { id: number }> implements Repository<T> {
+  private readonly items = new Map<number, T>();
+
+  async find(id: number): Promise<T | undefined> {
+    return this.items.get(id);
+  }
+
+  async save(item: T): Promise<void> {
+    this.items.set(item.id, { ...item });
+  }
+}
+''',
+    'go': '''\
+package worker
+
+import (
+\t"context"
+\t"fmt"
+\t"sync"
+)
+
+// Process runs fn over items with n goroutines and collects the errors.
+func Process(ctx context.Context, items []string, n int, fn func(string) error) []error {
+\tvar wg sync.WaitGroup
+\terrs := make(chan error, len(items))
+\tsem := make(chan struct{}, n)
+\tfor _, item := range items {
+\t\twg.Add(1)
+\t\tgo func(item string) {
+\t\t\tdefer wg.Done()
+\t\t\tsem <- struct{}{}
+\t\t\tdefer func() { <-sem }()
+\t\t\tif err := fn(item); err != nil {
+\t\t\t\terrs <- fmt.Errorf("%s: %w", item, err)
+\t\t\t}
+\t\t}(item)
+\t}
+\twg.Wait()
+\tclose(errs)
+\tvar out []error
+\tfor err := range errs {
+\t\tout = append(out, err)
+\t}
+\treturn out
+}
+''',
+    'rs': '''\
+use std::collections::HashMap;
+
+/// Count word frequencies, most frequent first.
+pub fn word_counts(text: &str) -> Vec<(String, usize)> {
+    let mut counts: HashMap<String, usize> = HashMap::new();
+    for word in text.split_whitespace() {
+        *counts.entry(word.to_lowercase()).or_insert(0) += 1;
+    }
+    let mut pairs: Vec<_> = counts.into_iter().collect();
+    pairs.sort_by(|a, b| b.1.cmp(&a.1).then_with(|| a.0.cmp(&b.0)));
+    pairs
+}
+''',
+    'java': '''\
+package com.example.cache;
+
+import java.util.LinkedHashMap;
+import java.util.Map;
+
+public final class LruCache<K, V> extends LinkedHashMap<K, V> {
+    private final int capacity;
+
+    public LruCache(int capacity) {
+        super(16, 0.75f, true);
+        this.capacity = capacity;
+    }
+
+    @Override
+    protected boolean removeEldestEntry(Map.Entry<K, V> eldest) {
+        return size() > capacity;
+    }
+}
+''',
+    'c': '''\
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+/* Read a whole file into a NUL-terminated buffer. */
+char *read_file(const char *path, size_t *length) {
+    FILE *f = fopen(path, "rb");
+    if (!f) return NULL;
+    fseek(f, 0, SEEK_END);
+    long size = ftell(f);
+    rewind(f);
+    char *buffer = malloc(size + 1);
+    if (buffer && fread(buffer, 1, size, f) == (size_t)size) {
+        buffer[size] = '\\0';
+        *length = size;
+    }
+    fclose(f);
+    return buffer;
+}
+''',
+    'rb': '''\
+require 'json'
+
+module Inventory
+  class Item
+    attr_reader :sku, :quantity
+
+    def initialize(sku:, quantity: 0)
+      @sku = sku
+      @quantity = quantity
+    end
+
+    def restock!(amount)
+      raise ArgumentError, "amount must be positive" unless amount.positive?
+      @quantity += amount
+      self
+    end
+
+    def to_json(*args) = { sku: sku, quantity: quantity }.to_json(*args)
+  end
+end
+''',
+    'php': '''\
+<?php
+declare(strict_types=1);
+
+namespace App\\Http;
+
+final class Router
+{
+    /** @var array<string, callable> */
+    private array $routes = [];
+
+    public function get(string $path, callable $handler): void
+    {
+        $this->routes["GET $path"] = $handler;
+    }
+
+    public function dispatch(string $method, string $path): string
+    {
+        $handler = $this->routes["$method $path"] ?? fn() => '404 Not Found';
+        return (string) $handler();
+    }
+}
+''',
+    'sh': '''\
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Back up every database listed in $DATABASES, keeping the last 7 days
+backup_dir="${BACKUP_DIR:-/var/backups/db}"
+mkdir -p "$backup_dir"
+for db in ${DATABASES:-app}; do
+    file="$backup_dir/${db}-$(date +%F).sql.gz"
+    if pg_dump "$db" | gzip > "$file"; then
+        echo "backed up $db to $file"
+    else
+        echo "backup of $db failed" >&2
+    fi
+done
+find "$backup_dir" -name '*.sql.gz' -mtime +7 -delete
+''',
+    'sql': '''\
+-- Monthly revenue per customer, with a running total
+WITH monthly AS (
+    SELECT c.id AS customer_id,
+           date_trunc('month', o.created_at) AS month,
+           SUM(o.amount_cents) / 100.0 AS revenue
+    FROM customers c
+    JOIN orders o ON o.customer_id = c.id
+    WHERE o.status = 'paid' AND o.created_at >= NOW() - INTERVAL '1 year'
+    GROUP BY 1, 2
+)
+SELECT customer_id, month, revenue,
+       SUM(revenue) OVER (PARTITION BY customer_id ORDER BY month) AS running_total
+FROM monthly
+ORDER BY customer_id, month;
+''',
+    'yaml': '''\
+# CI pipeline
+name: test
+on:
+  push:
+    branches: [main]
+  pull_request:
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    strategy:
+      matrix:
+        python: ["3.13", "3.14"]
+    steps:
+      - uses: actions/checkout@v4
+      - run: pip install -e . && python -m pytest -q
+        env:
+          PYTHONWARNINGS: error
+''',
+}
+
+# Size name -> (approximate line count, timed renders per case)
+SIZES = {
+    'tiny': (0, 30),  # The sample as is
+    'medium': (400, 5),
+    'huge': (5000, 1),
+}
+
+FORMATS = ('svg', 'html')
+
+# (metric, True when higher is better); compared against the baseline
+COMPARED_METRICS = [
+    ('snippets_per_s', True),
+    ('mb_per_s', True),
+    ('p50_ms', False),
+    ('p90_ms', False),
+    ('peak_traced_mb', False),
+]
+
+
+def build_corpus(sizes=SIZES, languages=SAMPLES):
+    """
+    Build the synthetic corpus.
+
+    Returns:
+        List of (size, extension, code, highlight spec) cases
+    """
+    corpus = []
+    for size in sizes:
+        line_count = SIZES[size][0]
+        for extension in languages:
+            sample = SAMPLES[extension]
+            copies = max(1, line_count // sample.count('\n'))
+            code = sample * copies
+            corpus.append((size, extension, code, highlight_spec(code.count('\n'))))
+    return corpus
+
+
+def highlight_spec(line_count):
+    """A heavy highlight spec: a range every few lines and an open-ended tail."""
+    ranges = [f"{line}-{line + 1}" if line % 2 else str(line)
+              for line in range(1, line_count, 3)]
+    return ' '.join(ranges + [f"{max(1, line_count - 5)}-"])
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of values."""
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run_suite(corpus, formats=FORMATS, style='monokai', repeat=1.0, verbose=True):
+    """
+    Render every case of the corpus in every format and measure it.
+
+    Cases are timed without tracing. Peak memory is traced with tracemalloc
+    in a separate render of each size's largest case per format, since
+    tracing slows rendering down several times. Tokens are never cached
+    between renders, so every render lexes its input like a first render does.
+
+    Args:
+        corpus: Cases as returned by build_corpus()
+        formats: Output formats to render each case in
+        style: Pygments style name
+        repeat: Multiplier for the number of timed renders per case
+        verbose: Print a line per size as it finishes
+
+    Returns:
+        Results dict, as saved in a baseline file
+    """
+    sizes = {}
+    total_time = total_bytes = renders = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        def render_case(extension, code, spec, format_type):
+            code_to_image(code, os.path.join(tmp, f'out.{format_type}'), format_type=format_type,
+                          filename=f'sample.{extension}', style=style, highlight_lines=spec,
+                          verbose=False)
+
+        # Warm up lexers and formatters so setup doesn't count as render time
+        for extension, sample in SAMPLES.items():
+            for format_type in formats:
+                render_case(extension, sample, '1', format_type)
+
+        for size in dict.fromkeys(case[0] for case in corpus):
+            cases = [case for case in corpus if case[0] == size]
+            count = max(1, round(SIZES[size][1] * repeat))
+            latencies = []
+            peak = size_time = size_bytes = 0
+            _, extension, code, spec = max(cases, key=lambda case: len(case[2]))
+            for format_type in formats:
+                tracemalloc.start()
+                render_case(extension, code, spec, format_type)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            for _, extension, code, spec in cases:
+                code_bytes = len(code.encode('utf-8'))
+                for format_type in formats:
+                    for _ in range(count):
+                        start = time.perf_counter()
+                        render_case(extension, code, spec, format_type)
+                        latencies.append(time.perf_counter() - start)
+                        size_bytes += code_bytes
+                    size_time += sum(latencies[-count:])
+            sizes[size] = {
+                'renders': len(latencies),
+                'snippets_per_s': len(latencies) / size_time,
+                'mb_per_s': size_bytes / 1024 / 1024 / size_time,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p90_ms': percentile(latencies, 90) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': max(latencies) * 1000,
+                'peak_traced_mb': peak / 1024 / 1024,
+            }
+            total_time += size_time
+            total_bytes += size_bytes
+            renders += len(latencies)
+            if verbose:
+                print(f"{size}: {len(latencies)} renders in {size_time:.2f} s", file=sys.stderr)
+
+    return {
+        'python': platform.python_version(),
+        'pygments': pygments.__version__,
+        'languages': sorted({case[1] for case in corpus}),
+        'formats': list(formats),
+        'style': style,
+        'overall': {
+            'renders': renders,
+            'snippets_per_s': renders / total_time,
+            'mb_per_s': total_bytes / 1024 / 1024 / total_time,
+            'peak_rss_mb': peak_rss() / 1024 / 1024 if peak_rss() is not None else None,
+        },
+        'sizes': sizes,
+    }
+
+
+def format_results(results):
+    """Format suite results as a table."""
+    overall = results['overall']
+    lines = [f"Python {results['python']}, pygments {results['pygments']}; "
+             f"{len(results['languages'])} languages, {'/'.join(results['formats']).upper()}, "
+             f"style {results['style']}",
+             f"{'size':>8} {'renders':>8} {'snippets/s':>11} {'MB/s':>7} {'p50 ms':>9} "
+             f"{'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'peak MB':>8}"]
+    for size, stats in results['sizes'].items():
+        lines.append(f"{size:>8} {stats['renders']:>8} {stats['snippets_per_s']:>11.1f} "
+                     f"{stats['mb_per_s']:>7.2f} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+                     f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f} "
+                     f"{stats['peak_traced_mb']:>8.1f}")
+    rss = overall['peak_rss_mb']
+    lines.append(f"{'all':>8} {overall['renders']:>8} {overall['snippets_per_s']:>11.1f} "
+                 f"{overall['mb_per_s']:>7.2f}" + (f"  (peak RSS {rss:.0f}MB)" if rss else ''))
+    return '\n'.join(lines)
+
+
+def compare(results, baseline, threshold=10.0):
+    """
+    Compare results against a baseline.
+
+    Args:
+        results: Results of run_suite()
+        baseline: Results of an earlier run, e.g. loaded from a baseline file
+        threshold: Percentage by which a metric may get worse before it counts
+            as a regression
+
+    Returns:
+        List of (name, baseline value, current value, change in percent,
+        regressed) tuples for the metrics both runs have
+    """
+    rows = []
+    groups = [(size, stats, baseline.get('sizes', {}).get(size, {}))
+              for size, stats in results['sizes'].items()]
+    # Overall throughput depends on the mix of sizes
+    if list(baseline.get('sizes', {})) == list(results['sizes']):
+        groups.insert(0, ('all', results['overall'], baseline.get('overall', {})))
+    for group, current, previous in groups:
+        for metric, higher_is_better in COMPARED_METRICS:
+            if metric not in current or not previous.get(metric):
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric] * 100
+            worse = -change if higher_is_better else change
+            rows.append((f"{group} {metric}", previous[metric], current[metric], change,
+                         worse > threshold))
+    return rows
+
+
+def format_comparison(rows, threshold):
+    """Format compare() rows as a table."""
+    lines = [f"{'metric':>24} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name, previous, current, change, regressed in rows:
+        status = f"  REGRESSION (>{threshold:g}%)" if regressed else ''
+        lines.append(f"{name:>24} {previous:>10.2f} {current:>10.2f} {change:>+7.1f}%{status}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='snippet2image bench',
+        description='Benchmark snippet2image on a synthetic multi-language corpus',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Record a baseline before a change, then check the change against it
+  snippet2image bench --save-baseline bench.json
+  snippet2image bench --baseline bench.json --threshold 5
+
+  # A quick run without the huge files
+  snippet2image bench --sizes tiny medium
+        """
+    )
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES),
+                        help='File sizes to render (default: all)')
+    parser.add_argument('--languages', nargs='+', choices=list(SAMPLES), default=list(SAMPLES),
+                        metavar='EXTENSION',
+                        help=f"Languages to render, by extension (default: all of "
+                             f"{', '.join(SAMPLES)})")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS),
+                        help='Output formats (default: svg html)')
+    parser.add_argument('-s', '--style', type=str, default='monokai',
+                        help='Pygments style name (default: monokai)')
+    parser.add_argument('--repeat', type=float, default=1.0,
+                        help='Multiply the number of timed renders per case (default: 1)')
+    parser.add_argument('--baseline', type=str, metavar='PATH',
+                        help='Compare against a saved baseline and exit with status 1 '
+                             'on a regression')
+    parser.add_argument('--threshold', type=float, default=10.0, metavar='PERCENT',
+                        help='How much worse a metric may get before it is a regression '
+                             '(default: 10)')
+    parser.add_argument('--save-baseline', type=str, metavar='PATH',
+                        help='Save the results as a baseline for later runs')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON instead of a table')
+
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading baseline: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    corpus = build_corpus(args.sizes, args.languages)
+    results = run_suite(corpus, args.formats, style=args.style, repeat=args.repeat,
+                        verbose=not args.json)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to: {args.save_baseline}", file=sys.stderr)
+
+    if baseline is not None:
+        for key in ('python', 'pygments', 'languages', 'formats', 'style'):
+            if baseline.get(key) != results[key]:
+                print(f"Warning: baseline has {key} {baseline.get(key)!r}, "
+                      f"this run {results[key]!r}", file=sys.stderr)
+        rows = compare(results, baseline, args.threshold)
+        print(format_comparison(rows, args.threshold), file=sys.stderr)
+        regressions = sum(row[4] for row in rows)
+        if regressions:
+            print(f"{regressions} metrics regressed by more than {args.threshold:g}%",
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+snippet2image_client - Lightweight client for the snippet2image render server.
+
+Start the server once with `snippet2image.py --serve`, then render through it
+without paying for Python's pygments import on every call. This module only
+uses the standard library so that it starts as fast as the interpreter does.
+"""
+
+import sys
+import argparse
+import os
+import json
+import socket
+
+
+def default_socket_path():
+    """Default Unix socket path for the render server (per user)."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'snippet2image.sock')
+    return f"/tmp/snippet2image-{os.getuid()}.sock"
+
+
+def render(request, socket_path=None, timeout=30):
+    """
+    Send one render request to the server and wait for its response.
+
+    Args:
+        request: Render request (a manifest entry: 'output', 'input' or 'code',
+            and optional overrides such as 'style' or 'highlight_lines')
+        socket_path: Server socket path (default: default_socket_path())
+        timeout: Seconds to wait for the server (default: 30)
+
+    Returns:
+        Response dict: {"ok": true, "language": ..., "output": ...} or
+        {"ok": false, "error": ...}
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("Server closed the connection without a response")
+    return json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render a code snippet through a running snippet2image server',
+        epilog='Start the server with: python snippet2image.py --serve'
+    )
+    parser.add_argument('-S', '--socket', type=str, default=default_socket_path(),
+                       help=f'Server socket path (default: {default_socket_path()})')
+    parser.add_argument('-i', '--input', type=str,
+                       help='Input file (if not provided, reads from stdin)')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                       help='Output file path (.svg, .svgz or .html)')
+    parser.add_argument('-f', '--format', type=str, choices=['svg', 'html'],
+                       help='Output format (auto-detect from extension if not specified)')
+    parser.add_argument('-l', '--language', type=str,
+                       help='Programming language (auto-detect if not specified)')
+    parser.add_argument('-s', '--style', type=str,
+                       help='Pygments style name (default: server default)')
+    parser.add_argument('--dark-style', type=str, metavar='STYLE',
+                       help='SVG: also embed this style for viewers that prefer a dark color scheme')
+    parser.add_argument('--html-css', choices=['inline', 'embedded', 'external'],
+                       help='HTML styling: inline styles, embedded stylesheet or external stylesheet')
+    parser.add_argument('--precompress', nargs='+', choices=['gzip', 'br'], metavar='ENCODING',
+                       help='Also write pre-compressed copies next to the output: gzip and/or br')
+    parser.add_argument('--compact-svg', action='store_true',
+                       help='SVG: merge runs, use CSS classes and drop redundant markup')
+    parser.add_argument('--font', type=str,
+                       help='Font family (default: server default)')
+    parser.add_argument('--font-size', type=int,
+                       help='Font size in pixels (default: server default)')
+    parser.add_argument('--opaque-background', action='store_true',
+                       help='Use opaque background instead of transparent')
+    parser.add_argument('--highlight-lines', type=str,
+                       help='Lines to highlight (space-separated, supports ranges like "8-10 15 20-22" and "100-")')
+    parser.add_argument('--highlight-color', type=str,
+                       help='Background color for highlighted lines')
+
+    args = parser.parse_args()
+
+    # The server has its own working directory, so send absolute paths
+    request = {'output': os.path.abspath(args.output)}
+    if args.input:
+        request['input'] = os.path.abspath(args.input)
+    else:
+        request['code'] = sys.stdin.read()
+
+    options = {
+        'format': args.format,
+        'language': args.language,
+        'style': args.style,
+        'dark_style': args.dark_style,
+        'html_css': args.html_css,
+        'font': args.font,
+        'font_size': args.font_size,
+        'highlight_lines': args.highlight_lines,
+        'highlight_color': args.highlight_color,
+        'precompress': args.precompress,
+    }
+    request.update({key: value for key, value in options.items() if value is not None})
+    if args.opaque_background:
+        request['opaque_background'] = True
+    if args.compact_svg:
+        request['compact_svg'] = True
+
+    try:
+        response = render(request, args.socket)
+    except OSError as e:
+        print(f"Error: cannot reach server at {args.socket}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not response.get('ok'):
+        print(f"Error: {response.get('error')}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Saved to: {response['output']}")
+    print(f"Language: {response['language']}")
+
+
+if __name__ == '__main__':
+    main()
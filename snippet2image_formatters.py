@@ -0,0 +1,476 @@
+"""
+snippet2image_formatters - The pygments formatters behind snippet2image's output.
+
+Kept apart from snippet2image so that the command line only imports
+pygments' formatters when it renders something; snippet2image imports this
+module on first use and re-exports its formatters.
+"""
+
+import copy
+from pygments.formatters import SvgFormatter, HtmlFormatter
+from pygments.styles import get_style_by_name
+from pygments.token import STANDARD_TYPES, Comment, Text
+from pygments.util import get_bool_opt
+try:
+    from pygments.util import html_escape
+except ImportError:  # pygments < 2.20
+    from pygments.formatters.svg import escape_html as html_escape
+
+
+class SnippetSvgFormatter(SvgFormatter):
+    """
+    SVG formatter that writes the final document in a single pass.
+
+    Unlike pygments' SvgFormatter output, which add_svg_highlights() and
+    string replacements used to patch afterwards, the document comes out
+    with its width, height and viewBox, the highlight rectangles in front of
+    their lines and (unless transparent) a background in the style's color.
+
+    With a dark_style, tokens get short CSS classes instead of fill
+    attributes and the document embeds a light and a dark color table, the
+    latter selected by @media (prefers-color-scheme: dark), so one file
+    follows the viewer's color scheme.
+
+    With compact, tokens get CSS classes as well and the document is written
+    for size: adjacent runs of the same class are merged, each line is a
+    <tspan> of one <text> for the code, the line numbers share another
+    <text>, and the XML prolog and newlines are left out. It renders the
+    same as the default output at a fraction of its size.
+
+    The formatter built for a style is reused; for_document() returns a
+    cheap copy carrying one document's geometry and highlighted lines.
+    """
+
+    MAX_MEMOIZED_TOKENS = 4096
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.transparent = get_bool_opt(options, 'transparent', True)
+        self.highlight_color = options.get('highlight_color', '#ffffcc')
+        self.highlight_lines = ()  # A LineRanges, set by for_document()
+        self.width = self.height = None
+        dark_style = options.get('dark_style')
+        if isinstance(dark_style, str):
+            dark_style = get_style_by_name(dark_style)
+        self.dark_style = dark_style
+        self.compact = get_bool_opt(options, 'compact', False)
+        self.line_count = None
+        self.css_classes = dark_style is not None or self.compact
+        if self.css_classes:
+            self._token_classes, self._theme_css = self._build_themes()
+
+    @staticmethod
+    def _declarations(style, ttype):
+        """CSS declarations for a token type under a style."""
+        value = style.style_for_token(ttype)
+        declarations = {}
+        if value['color']:
+            declarations['fill'] = '#' + value['color']
+        if value['bold']:
+            declarations['font-weight'] = 'bold'
+        if value['italic']:
+            declarations['font-style'] = 'italic'
+        return declarations
+
+    def _build_themes(self):
+        """
+        Build the class of every standard token type and the color tables.
+
+        There is a dark table, selected by a media query, only with a dark_style.
+
+        Returns:
+            Tuple of ({token type: ' class="..."'}, CSS for a <style> element)
+        """
+        themes = {'light': self.style}
+        if self.dark_style is not None:
+            themes['dark'] = self.dark_style
+        # Text sets the document's default, which the other classes inherit
+        root = {theme: self._declarations(style, Text) for theme, style in themes.items()}
+        # Undo light declarations the dark theme doesn't override: classes go
+        # back to the document's default, the document to SVG's initial values
+        resets = {'fill': 'inherit', 'font-weight': 'normal', 'font-style': 'normal'}
+        root_resets = dict(resets, fill='#000000')
+        rules = {'light': {'svg': root['light']}}
+        if self.compact:
+            # Merged runs keep their spaces only if whitespace is preserved
+            rules['light']['text'] = {'white-space': 'pre'}
+            rules['light']['.hl'] = {'fill': self.highlight_color, 'fill-opacity': '0.3'}
+        if self.dark_style is not None:
+            rules['dark'] = {'svg': {**{key: root_resets[key] for key in root['light']},
+                                     **root['dark']}}
+        if not self.transparent:
+            for theme, style in themes.items():
+                rules[theme]['.bg'] = {'fill': style.background_color}
+
+        token_classes = {}
+        for ttype, name in STANDARD_TYPES.items():
+            declarations = {theme: self._declarations(style, ttype)
+                            for theme, style in themes.items()}
+            if not name or declarations == root:
+                continue  # Looks like plain text in every theme
+            token_classes[ttype] = f' class="{name}"'
+            rules['light'][f'.{name}'] = light = declarations['light']
+            if 'dark' in themes:
+                rules['dark'][f'.{name}'] = {**{key: resets[key] for key in light},
+                                             **declarations['dark']}
+
+        def css(theme_rules):
+            # Group selectors with identical declarations to keep the tables small
+            groups = {}
+            for selector, declarations in theme_rules.items():
+                if declarations:
+                    body = ';'.join(f'{key}:{value}' for key, value in declarations.items())
+                    groups.setdefault(body, []).append(selector)
+            return ''.join(f"{','.join(selectors)}{{{body}}}" for body, selectors in groups.items())
+
+        stylesheet = css(rules['light'])
+        if 'dark' in rules:
+            stylesheet += f"@media (prefers-color-scheme: dark){{{css(rules['dark'])}}}"
+        return token_classes, stylesheet
+
+    def _get_style(self, tokentype):
+        if not self.css_classes:
+            return super()._get_style(tokentype)
+        result = self._stylecache.get(tokentype)
+        if result is None:
+            # Subtypes a lexer made up look like their nearest standard parent
+            ttype = tokentype
+            while ttype not in STANDARD_TYPES:
+                ttype = ttype.parent
+            result = self._stylecache[tokentype] = self._token_classes.get(ttype, '')
+        return result
+
+    def for_document(self, width, height, highlight_lines=None, line_count=None):
+        """
+        Return a copy of this formatter configured for one document.
+
+        highlight_lines is a snippet2image.LineRanges (default: no highlighted
+        lines); Renderer coerces line specs into one before calling this.
+
+        The compact document writes the line numbers before the code, so it
+        needs the number of lexed lines (see lexed_line_count()); without
+        line_count the tokens are collected to count them first.
+        """
+        formatter = copy.copy(self)
+        formatter.width = width
+        formatter.height = height
+        formatter.highlight_lines = highlight_lines if highlight_lines is not None else ()
+        formatter.line_count = line_count
+        return formatter
+
+    def _wrap_token(self, ttype, value):
+        """Escape a token and wrap each of its lines in a styled tspan."""
+        style = self._get_style(ttype)
+        tspan = style and '<tspan' + style + '>' or ''
+        tspanend = tspan and '</tspan>' or ''
+        value = html_escape(value)
+        if self.spacehack:
+            value = value.expandtabs().replace(' ', '&#160;')
+        return [tspan + part + tspanend for part in value.split('\n')]
+
+    def _highlight_rect(self, y):
+        # Cover the whole line, starting above the text baseline
+        font_size = float(self.yoffset)
+        return (
+            f'<rect x="0" y="{y - font_size * 0.85}" width="{self.width}" '
+            f'height="{font_size * 1.2}" fill="{self.highlight_color}" '
+            f'fill-opacity="0.3"/>\n'
+        )
+
+    def format_unencoded(self, tokensource, outfile):
+        if self.compact:
+            self._format_compact(tokensource, outfile)
+            return
+
+        x = self.xoffset
+        y = self.yoffset
+        highlight_lines = self.highlight_lines
+        write = outfile.write
+
+        if not self.nowrap:
+            if self.encoding:
+                write(f'<?xml version="1.0" encoding="{self.encoding}"?>\n')
+            else:
+                write('<?xml version="1.0"?>\n')
+            write('<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.0//EN" '
+                  '"http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/'
+                  'svg10.dtd">\n')
+            if self.width is not None:
+                write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" '
+                      f'height="{self.height}" viewBox="0 0 {self.width} {self.height}">\n')
+            else:
+                write('<svg xmlns="http://www.w3.org/2000/svg">\n')
+            if self.dark_style is not None:
+                write(f'<style>{self._theme_css}</style>\n')
+                if not self.transparent:
+                    write('<rect class="bg" width="100%" height="100%"/>\n')
+            elif not self.transparent and self.style.background_color:
+                write(f'<rect width="100%" height="100%" '
+                      f'fill="{self.style.background_color}"/>\n')
+            write(f'<g font-family="{self.fontfamily}" font-size="{self.fontsize}">\n')
+
+        counter = self.linenostart
+        counter_step = self.linenostep
+        counter_style = self._get_style(Comment)
+        line_x = x
+        lineno_x = x + self.linenowidth
+
+        if counter in highlight_lines:
+            write(self._highlight_rect(y))
+        if self.linenos:
+            if counter % counter_step == 0:
+                write(f'<text x="{lineno_x}" y="{y}" {counter_style} text-anchor="end">{counter}</text>')
+            line_x += self.linenowidth + self.ystep
+        counter += 1
+
+        line_start = f'<text x="{line_x}" y="{{}}" xml:space="preserve">'
+        write(line_start.format(y))
+        # Tokens repeat a lot (keywords, punctuation, indentation), so their
+        # escaped and wrapped form is memoized for the document
+        pieces = {}
+        for token in tokensource:
+            wrapped = pieces.get(token)
+            if wrapped is None:
+                wrapped = self._wrap_token(*token)
+                if len(pieces) < self.MAX_MEMOIZED_TOKENS:
+                    pieces[token] = wrapped
+            if len(wrapped) == 1:
+                write(wrapped[0])
+                continue
+            for part in wrapped[:-1]:
+                write(part)
+                y += self.ystep
+                write('</text>\n')
+                if counter in highlight_lines:
+                    write(self._highlight_rect(y))
+                if self.linenos and counter % counter_step == 0:
+                    write(f'<text x="{lineno_x}" y="{y}" text-anchor="end" {counter_style}>{counter}</text>')
+                counter += 1
+                write(line_start.format(y))
+            write(wrapped[-1])
+        write('</text>')
+
+        if not self.nowrap:
+            write('</g></svg>\n')
+
+    def _compact_token(self, ttype, value):
+        """Class, escaped lines and whether it's all whitespace, for the compact document."""
+        lines = html_escape(value).expandtabs().split('\n')
+        return self._get_style(ttype), lines, lines[0].isspace()
+
+    def _format_compact(self, tokensource, outfile):
+        """Write the compact document; see the class docstring."""
+        line_count = self.line_count
+        if line_count is None:
+            tokensource = list(tokensource)
+            line_count = sum(value.count('\n') for _, value in tokensource)
+        # Like the default output, number the line after the last newline too
+        line_count += 1
+        first, last = self.linenostart, self.linenostart + line_count - 1
+        x, y, ystep = self.xoffset, self.yoffset, self.ystep
+        write = outfile.write
+
+        if not self.nowrap:
+            size = ''
+            if self.width is not None:
+                size = (f' width="{self.width}" height="{self.height}" '
+                        f'viewBox="0 0 {self.width} {self.height}"')
+            write(f'<svg xmlns="http://www.w3.org/2000/svg" xml:space="preserve"{size}>'
+                  f'<style>{self._theme_css}</style>')
+            if not self.transparent:
+                write('<rect class="bg" width="100%" height="100%"/>')
+            write(f'<g font-family="{self.fontfamily}" font-size="{self.fontsize}">')
+
+        font_size = float(self.yoffset)
+        rect = (f'<rect class="hl" y="{{}}" width="{self.width}" '
+                f'height="{_compact_number(font_size * 1.2)}"/>')
+        for start, end in self.highlight_lines.intervals if self.highlight_lines else ():
+            for counter in range(max(start, first), min(last if end is None else end, last) + 1):
+                write(rect.format(_compact_number(y + (counter - first) * ystep - font_size * 0.85)))
+
+        code_x = x
+        if self.linenos:
+            lineno_x = x + self.linenowidth
+            code_x += self.linenowidth + ystep
+            write(f'<text{self._get_style(Comment)} text-anchor="end">')
+            step = self.linenostep
+            for counter in range(first + (-first) % step, last + 1, step):
+                write(f'<tspan x="{lineno_x}" y="{y + (counter - first) * ystep}">{counter}</tspan>')
+            write('</text>')
+
+        write('<text>')
+        line_start = f'<tspan x="{code_x}" y="{{}}">'
+        line_open = False   # Whether the current line's <tspan> is written
+        run_class = ''      # Class of the run being merged
+        run = []            # Its escaped text, never empty while the line is open
+        pieces = {}
+        for token in tokensource:
+            piece = pieces.get(token)
+            if piece is None:
+                piece = self._compact_token(*token)
+                if len(pieces) < self.MAX_MEMOIZED_TOKENS:
+                    pieces[token] = piece
+            token_class, lines, blank = piece
+            if line_open and len(lines) == 1 and (token_class == run_class or blank):
+                # Most tokens continue the run; whitespace looks the same in any class
+                run.append(lines[0])
+                continue
+            for i, text in enumerate(lines):
+                if i:
+                    # A newline ends the run and the line
+                    if line_open:
+                        write(f'<tspan{run_class}>{"".join(run)}</tspan></tspan>'
+                              if run_class else f'{"".join(run)}</tspan>')
+                        line_open = False
+                    run = []
+                    y += ystep
+                if not text:
+                    continue
+                if not line_open:
+                    write(line_start.format(y))
+                    line_open = True
+                    run_class = token_class
+                elif token_class != run_class and not text.isspace():
+                    write(f'<tspan{run_class}>{"".join(run)}</tspan>'
+                          if run_class else ''.join(run))
+                    run = []
+                    run_class = token_class
+                run.append(text)
+        if line_open:
+            write(f'<tspan{run_class}>{"".join(run)}</tspan></tspan>'
+                  if run_class else f'{"".join(run)}</tspan>')
+        write('</text>')
+
+        if not self.nowrap:
+            write('</g></svg>\n')
+
+
+def _compact_number(value):
+    """Format a coordinate with at most two decimals and no trailing zeros."""
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+class SnippetHtmlFormatter(HtmlFormatter):
+    """
+    HTML formatter whose markup comes out final, without regex post-processing.
+
+    On top of pygments' HtmlFormatter it gives the line number column the
+    same line-height as the code (so the two stay aligned), paints
+    highlighted lines in a custom color and can make the container
+    background transparent.
+
+    With noclasses=False the same settings go into stylesheet() instead of
+    inline styles, and embed_stylesheet puts it in front of the markup.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.transparent = get_bool_opt(options, 'transparent', True)
+        self.highlight_color = options.get('highlight_color', '#ffffcc')
+        self.embed_stylesheet = get_bool_opt(options, 'embed_stylesheet', False)
+        self.line_count = None
+
+    def stylesheet(self):
+        """CSS for markup written with CSS classes, scoped to the cssclass."""
+        prefix = f'.{self.cssclass}'
+        # pygments' line number and <pre> rules are global; scope them too, so
+        # they neither clash between styles nor restyle the rest of the page
+        rules = [
+            f'{prefix} pre {{ {self._pre_style} }}',
+            f'{prefix} td.linenos .normal {{ {self._linenos_style} }}',
+            f'{prefix} span.linenos {{ {self._linenos_style} }}',
+            f'{prefix} td.linenos .special {{ {self._linenos_special_style} }}',
+            f'{prefix} span.linenos.special {{ {self._linenos_special_style} }}',
+            *self.get_background_style_defs(prefix),
+            *self.get_token_style_defs(prefix),
+        ]
+        if self.transparent:
+            rules.append(f'{prefix} {{ background: transparent }}')
+        if self.highlight_color:
+            rules.append(f'{prefix} .hll {{ background-color: {self.highlight_color} }}')
+        return '\n'.join(rules) + '\n'
+
+    def format_unencoded(self, tokensource, outfile):
+        if self.embed_stylesheet and not self.noclasses:
+            outfile.write(f'<style>\n{self.stylesheet()}</style>\n')
+        super().format_unencoded(tokensource, outfile)
+
+    def for_document(self, line_count):
+        """
+        Return a copy of this formatter for a document of line_count lines.
+
+        Knowing the line count up front lets the line number column be written
+        before the code, so the document streams out instead of being buffered.
+        """
+        formatter = copy.copy(self)
+        formatter.line_count = line_count
+        return formatter
+
+    @property
+    def _linenos_pre(self):
+        # The code section has line-height: 125%, so line numbers need the same
+        if self.noclasses:
+            return f'<td class="linenos"><div class="linenodiv"><pre style="{self._pre_style}">'
+        return '<td class="linenos"><div class="linenodiv"><pre>'
+
+    def _wrap_tablelinenos(self, inner):
+        if self.line_count is None:
+            # Let pygments count the lines, which buffers the whole document
+            first = True
+            for t, value in super()._wrap_tablelinenos(inner):
+                if first:
+                    value = value.replace(
+                        '<td class="linenos"><div class="linenodiv"><pre>', self._linenos_pre, 1)
+                    first = False
+                yield t, value
+            return
+
+        # Same markup as pygments' table, with the line numbers written first
+        filename_tr = ''
+        if self.filename:
+            filename_tr = ('<tr><th colspan="2" class="filename">'
+                           f'<span class="filename">{self.filename}</span></th></tr>')
+        yield 0, (f'<table class="{self.cssclass}table">{filename_tr}<tr>' + self._linenos_pre)
+        first = self.linenostart
+        width = len(str(self.line_count + first - 1))
+        for i in range(first, first + self.line_count):
+            if i % self.linenostep == 0:
+                line = '%*d' % (width, i)
+                if self.anchorlinenos:
+                    line = f'<a href="#{self.lineanchors or self.linespans}-{i}">{line}</a>'
+            else:
+                line = ' ' * width
+            special = self.linenospecial and i % self.linenospecial == 0
+            if self.noclasses:
+                style = f' style="{self._linenos_special_style if special else self._linenos_style}"'
+            else:
+                style = ' class="special"' if special else ' class="normal"'
+            line = f'<span{style}>{line}</span>'
+            yield 0, line if i == first else '\n' + line
+        yield 0, '</pre></div></td><td class="code"><div>'
+        yield from inner
+        yield 0, '</div></td></tr></table>'
+
+    def _wrap_div(self, inner):
+        if not (self.noclasses and self.transparent):
+            yield from super()._wrap_div(inner)
+            return
+        style = '; '.join(filter(None, ['background: transparent', self.cssstyles]))
+        yield 0, ('<div' + (self.cssclass and f' class="{self.cssclass}"') +
+                  f' style="{style}">')
+        yield from inner
+        yield 0, '</div>\n'
+
+    def _highlight_lines(self, tokensource):
+        if not (self.noclasses and self.highlight_color):
+            yield from super()._highlight_lines(tokensource)
+            return
+        hls = self.hl_lines
+        style = f' style="background-color: {self.highlight_color}"'
+        for i, (t, value) in enumerate(tokensource):
+            if t != 1:
+                yield t, value
+            elif i + 1 in hls:  # i + 1 because Python indexes start at 0
+                yield 1, f'<span{style}>{value}</span>'
+            else:
+                yield 1, value